@@ -0,0 +1,215 @@
+import time
+import random
+import threading
+from smolagents import ActionStep, PlanningStep, FinalAnswerStep
+from smolagents.models import is_rate_limit_error
+from smolagents.monitoring import LogLevel, Timing
+from smolagents.utils import AgentGenerationError
+from langfuse import get_client
+
+# EXÉCUTION D'AGENT BORNÉE (temps + tokens)
+#
+# max_steps ne borne pas la latence : une boucle sur rate limit peut durer des
+# minutes. Ici on consomme les étapes de l'agent une par une (run(stream=True))
+# et, dès que l'étape suivante risque de dépasser le budget, on arrête la boucle
+# et on force un final_answer construit à partir de la mémoire de l'agent.
+# Les agents gérés appelés pendant le run consomment le même budget, étape par
+# étape : une délégation ne peut pas le dépasser en un seul tour du manager.
+#
+# Pendant une étape, le délai d'un appel au modèle est borné par le temps restant
+# et un retry sur 429 n'est tenté que si son attente tient avant la deadline
+# (BudgetRetrying, installé sur les modèles par la passerelle). Le budget est
+# considéré épuisé une étape estimée plus tôt, pour laisser la place à l'appel
+# final_answer forcé ; s'il ne reste rien, la réponse est construite sans LLM.
+
+# Budget du run en cours dans ce thread (lu par BudgetRetrying)
+_active = threading.local()
+
+
+class RunBudget:
+    """
+    Budget d'une exécution d'agent. Le même objet peut être partagé entre
+    plusieurs tours d'un dialogue (run(..., reset=False)) : l'horloge démarre
+    au premier tour et les tokens s'additionnent.
+    """
+
+    def __init__(self, deadline_s: float = None, max_tokens: int = None):
+        self.deadline_s = deadline_s
+        self.max_tokens = max_tokens
+        self.started_at = None
+        self.tokens_used = 0
+        self.stop_reason = None
+        # Coût de la dernière étape : sert d'estimation pour la suivante
+        # (et pour l'appel final_answer forcé, qui relit toute la mémoire)
+        self._last_step_s = 0.0
+        self._last_step_tokens = 0
+
+    def start(self) -> None:
+        if self.started_at is None:
+            self.started_at = time.time()
+
+    def elapsed(self) -> float:
+        return time.time() - self.started_at if self.started_at else 0.0
+
+    def consume(self, step) -> None:
+        if step.timing is not None and step.timing.end_time is not None:
+            self._last_step_s = step.timing.duration
+        if step.token_usage is not None:
+            self._last_step_tokens = step.token_usage.total_tokens
+            self.tokens_used += step.token_usage.total_tokens
+
+    def remaining_s(self):
+        return None if self.deadline_s is None else self.deadline_s - self.elapsed()
+
+    def exhausted(self, reserve_steps: int = 2):
+        """
+        Retourne la raison de l'arrêt si `reserve_steps` étapes estimées de plus risquent
+        de dépasser le budget, sinon None. Par défaut : l'étape suivante + l'appel
+        final_answer forcé ; avec 0 : le budget est déjà entièrement consommé.
+        """
+        if self.deadline_s is not None and self.elapsed() + reserve_steps * self._last_step_s >= self.deadline_s:
+            return f"deadline de {self.deadline_s}s atteinte ({self.elapsed():.1f}s écoulées)"
+        if self.max_tokens is not None and self.tokens_used + reserve_steps * self._last_step_tokens >= self.max_tokens:
+            return f"budget de {self.max_tokens} tokens atteint ({self.tokens_used} consommés)"
+        return None
+
+
+class DeadlineExceeded(TimeoutError):
+    """Appel au modèle refusé : il ne tiendrait pas avant la deadline du budget."""
+
+
+class BudgetRetrying:
+    """
+    Remplace le retryer d'un modèle smolagents (`model.retryer`). Sans budget actif
+    dans le thread, délègue au retryer d'origine ; sinon borne le délai de chaque
+    appel au temps restant et n'attend un retry sur 429 que s'il tient avant la deadline.
+    """
+
+    def __init__(self, retryer):
+        self.retryer = retryer
+
+    def __call__(self, fn, *args, **kwargs):
+        budget = getattr(_active, "budget", None)
+        if budget is None or budget.deadline_s is None:
+            return self.retryer(fn, *args, **kwargs)
+
+        delay = self.retryer.wait_seconds
+        for attempt in range(1, self.retryer.max_attempts + 1):
+            remaining = budget.remaining_s()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"deadline de {budget.deadline_s}s atteinte avant l'appel au modèle")
+            try:
+                return fn(*args, **{**kwargs, "timeout": remaining})
+            except Exception as e:
+                if attempt == self.retryer.max_attempts or not is_rate_limit_error(e):
+                    raise
+                delay *= self.retryer.exponential_base * (1 + self.retryer.jitter * random.random())
+                if delay >= budget.remaining_s():
+                    raise DeadlineExceeded(
+                        f"rate limit : retry dans {delay:.0f}s, au-delà de la deadline de {budget.deadline_s}s"
+                    ) from e
+            time.sleep(delay)
+
+
+def _fallback_answer(agent, reason: str) -> str:
+    """Réponse sans appel LLM : la dernière observation utile de l'agent."""
+    for step in reversed(agent.memory.steps):
+        if isinstance(step, ActionStep) and (step.observations or step.action_output is not None):
+            gathered = step.observations or str(step.action_output)
+            return f"Réponse incomplète ({reason}). Dernières informations obtenues :\n{gathered}"
+    return f"Réponse impossible ({reason}) : aucune information obtenue."
+
+
+def _force_final_answer(agent, task: str, reason: str, budget: RunBudget, call_model: bool = True):
+    """Réponse finale construite à partir de ce que l'agent a déjà rassemblé."""
+    agent.logger.log(f"Arrêt anticipé : {reason}. Réponse finale forcée.", level=LogLevel.INFO)
+    start_time = time.time()
+    content, token_usage = None, None
+    # Plus rien dans le budget (ou modèle inaccessible avant la deadline) : pas d'appel LLM
+    if call_model and not budget.exhausted(reserve_steps=0):
+        chat_message = agent.provide_final_answer(task)
+        # provide_final_answer renvoie l'erreur comme contenu si l'appel échoue (deadline, rate limit)
+        if chat_message.token_usage is not None:
+            content, token_usage = chat_message.content, chat_message.token_usage
+            if isinstance(content, list):
+                content = "\n".join(part.get("text", "") for part in content)
+    if content is None:
+        content = _fallback_answer(agent, reason)
+
+    final_step = ActionStep(
+        step_number=agent.step_number,
+        timing=Timing(start_time=start_time, end_time=time.time()),
+        token_usage=token_usage,
+        is_final_answer=True,
+    )
+    # model_output reste visible dans la mémoire pour les tours suivants (reset=False)
+    final_step.model_output = content
+    final_step.action_output = content
+    agent._finalize_step(final_step)
+    agent.memory.steps.append(final_step)
+    return content, final_step
+
+
+def _budget_managed_agents(agent, budget: RunBudget) -> list:
+    """Fait passer les runs des agents gérés par run_with_budget ; retourne les agents à restaurer."""
+    hooked = []
+    for managed in agent.managed_agents.values():
+        # managed(task) appelle managed.run(...) : on le redirige vers un run borné par le même budget
+        managed.run = lambda task, reset=True, _managed=managed, **kwargs: run_with_budget(
+            _managed, task, budget, reset=reset, **kwargs
+        )
+        hooked.append(managed)
+    return hooked
+
+
+def run_with_budget(agent, task: str, budget: RunBudget, reset: bool = True, **run_kwargs):
+    """Équivalent de `agent.run(task, reset=...)` qui respecte `budget`, agents gérés compris."""
+    budget.start()
+    budget.stop_reason = None
+    run_kwargs.pop("stream", None)
+    # Méthode de la classe : `agent.run` peut être le relais installé par le manager
+    steps = type(agent).run(agent, task, stream=True, reset=reset, **run_kwargs)
+    hooked = _budget_managed_agents(agent, budget)
+    # Un agent géré peut tourner dans un autre thread (exécuteur local) : le budget y est rendu actif
+    previous, _active.budget = getattr(_active, "budget", None), budget
+
+    call_model = True
+    try:
+        try:
+            reason = budget.exhausted()
+            if reason is None:
+                for event in steps:
+                    if isinstance(event, FinalAnswerStep):
+                        get_client().update_current_trace(
+                            metadata={"stop_reason": "final_answer", "elapsed_s": round(budget.elapsed(), 2),
+                                      "tokens_used": budget.tokens_used}
+                        )
+                        return event.output
+                    if isinstance(event, (ActionStep, PlanningStep)):
+                        budget.consume(event)
+                        if isinstance(event, ActionStep) and event.is_final_answer:
+                            continue
+                        reason = budget.exhausted()
+                        if reason:
+                            break
+        except AgentGenerationError as e:
+            # Appel au modèle coupé ou refusé à cause de la deadline : arrêt anticipé plutôt qu'erreur
+            reason = str(e.__cause__) if isinstance(e.__cause__, DeadlineExceeded) else budget.exhausted(reserve_steps=0)
+            if reason is None:
+                raise
+            call_model = False
+        finally:
+            steps.close()
+            for managed in hooked:
+                del managed.run
+
+        budget.stop_reason = reason
+        answer, final_step = _force_final_answer(agent, task, reason, budget, call_model)
+    finally:
+        _active.budget = previous
+    budget.consume(final_step)
+    get_client().update_current_trace(
+        metadata={"stop_reason": "early_stop", "early_stop_reason": reason,
+                  "elapsed_s": round(budget.elapsed(), 2), "tokens_used": budget.tokens_used}
+    )
+    return answer
@@ -0,0 +1,108 @@
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+# POOL D'AGENTS PRÉCHAUFFÉS
+#
+# Construire un CodeAgent (outils, exécuteur Python, agents gérés) et rendre
+# son prompt système (template jinja + description de chaque outil) coûte à
+# chaque requête. Le pool construit les agents une fois, fige leur prompt
+# système, puis les prête et les remet à zéro à moindre coût entre deux requêtes.
+
+
+def _freeze_system_prompt(agent) -> None:
+    """Rend le prompt système une seule fois (smolagents le re-rend à chaque run)."""
+    rendered = agent.initialize_system_prompt()
+    agent.initialize_system_prompt = lambda: rendered
+    for managed in agent.managed_agents.values():
+        _freeze_system_prompt(managed)
+
+
+def reset_agent(agent) -> None:
+    """Remet un agent (et ses agents gérés) dans l'état d'un agent neuf, sans le reconstruire."""
+    agent.memory.reset()
+    agent.monitor.reset()
+    agent.state.clear()
+    agent.interrupt_switch = False
+    executor = getattr(agent, "python_executor", None)
+    if hasattr(executor, "reset"):
+        # Exécuteur du SandboxPool : nouvelle session côté worker
+        executor.reset()
+    elif executor is not None and isinstance(getattr(executor, "state", None), dict):
+        executor.state.clear()
+        executor.state["__name__"] = "__main__"
+    # Fonctions définies par le modèle lors de la requête précédente (sinon visibles par la table suivante)
+    if isinstance(getattr(executor, "custom_tools", None), dict):
+        executor.custom_tools.clear()
+    for managed in agent.managed_agents.values():
+        reset_agent(managed)
+
+
+class AgentPool:
+    def __init__(self, factory, size: int = 2):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"checkouts": 0, "wait_s": 0.0, "max_wait_s": 0.0, "reset_s": 0.0, "rebuilt": 0}
+
+        start = time.perf_counter()
+        for _ in range(size):
+            self._idle.put(self._build())
+        self.build_s = time.perf_counter() - start
+
+    def _build(self):
+        agent = self.factory()
+        _freeze_system_prompt(agent)
+        return agent
+
+    def _recycle(self, agent) -> float:
+        """Remet l'agent dans le pool ; s'il ne peut pas être remis à zéro, il est remplacé par un neuf."""
+        start = time.perf_counter()
+        try:
+            reset_agent(agent)
+        except Exception:
+            try:
+                agent = self._build()
+            except Exception:
+                # Impossible de le reconstruire : le pool rétrécit plutôt que de prêter un agent sale
+                with self._lock:
+                    self.size -= 1
+                raise
+            with self._lock:
+                self._stats["rebuilt"] += 1
+        self._idle.put(agent)
+        return time.perf_counter() - start
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """Prête un agent prêt à l'emploi ; il est remis à zéro et rendu au pool en sortie."""
+        if self.size <= 0:
+            raise RuntimeError("Pool d'agents vide : aucun agent n'a pu être reconstruit.")
+        start = time.perf_counter()
+        agent = self._idle.get(timeout=timeout)
+        wait = time.perf_counter() - start
+        try:
+            yield agent
+        finally:
+            reset = self._recycle(agent)
+            with self._lock:
+                self._stats["checkouts"] += 1
+                self._stats["wait_s"] += wait
+                self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait)
+                self._stats["reset_s"] += reset
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._stats["checkouts"]
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "build_ms": round(1000 * self.build_s, 2),
+                "checkouts": n,
+                "avg_checkout_wait_ms": round(1000 * self._stats["wait_s"] / n, 2) if n else 0.0,
+                "max_checkout_wait_ms": round(1000 * self._stats["max_wait_s"], 2),
+                "avg_reset_ms": round(1000 * self._stats["reset_s"] / n, 3) if n else 0.0,
+                "rebuilt": self._stats["rebuilt"],
+            }
@@ -0,0 +1,164 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langfuse import get_client
+from partie2 import plan_weekly_menu
+from llm_gateway import gateway
+
+# MODE BATCH : un enregistrement JSONL par foyer, ex :
+# {"id": "foyer-0001", "constraints": "Famille de 4 personnes, budget serré"}
+#
+# Le fichier d'entrée est lu en flux. Le checkpoint stocke un "watermark"
+# (toutes les lignes avant lui sont réglées), les lignes terminées au-delà et
+# les lignes en échec. On ne lance jamais une ligne à plus de MAX_AHEAD du
+# watermark : une ligne lente bloque la lecture au lieu de faire grossir le
+# checkpoint, dont la taille reste bornée (hors lignes en échec).
+#
+# Livraison "au moins une fois" : les échecs (rate limit, etc.) sont écrits
+# dans la sortie puis rejoués à la reprise, et un crash entre l'écriture d'un
+# résultat et le checkpoint est rattrapé en relisant la fin de la sortie. Une
+# même ligne peut donc apparaître plusieurs fois : le dernier résultat d'un
+# `line` fait foi.
+
+MAX_AHEAD_FACTOR = 16
+
+
+def _load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"watermark": 0, "done": [], "failed": []}
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    checkpoint.setdefault("failed", [])
+    return checkpoint
+
+
+def _save_checkpoint(path: str, watermark: int, done: set, failed: set) -> None:
+    """Écriture atomique : un crash ne laisse jamais un checkpoint à moitié écrit."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"watermark": watermark, "done": sorted(done), "failed": sorted(failed)}, f)
+    os.replace(tmp_path, path)
+
+
+def _recover_written(output_path: str, watermark: int) -> set:
+    """Lignes déjà réussies dans la sortie mais absentes du checkpoint (crash entre les deux écritures)."""
+    written = set()
+    if not os.path.exists(output_path):
+        return written
+    with open(output_path, encoding="utf-8") as f:
+        for row in f:
+            try:
+                result = json.loads(row)
+            except json.JSONDecodeError:
+                continue  # dernière ligne tronquée par un crash
+            if result.get("status") == "success" and result.get("line", -1) >= watermark:
+                written.add(result["line"])
+    return written
+
+
+def _iter_records(input_path: str):
+    """(numéro de ligne, enregistrement) ; None pour une ligne vide, une exception pour un JSON invalide."""
+    with open(input_path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                yield line_no, None
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, e
+
+
+def _plan_record(line_no: int, record: dict) -> dict:
+    result = plan_weekly_menu(record["constraints"])
+    return {"id": record.get("id", line_no), "line": line_no, **result}
+
+
+def run_batch(input_path: str, output_path: str, checkpoint_path: str = None, concurrency: int = 4) -> dict:
+    """Planifie un menu par enregistrement et écrit les résultats au fil de l'eau."""
+    checkpoint_path = checkpoint_path or f"{output_path}.ckpt"
+    checkpoint = _load_checkpoint(checkpoint_path)
+    watermark = checkpoint["watermark"]
+    done = set(checkpoint["done"]) | _recover_written(output_path, watermark)
+    # Échecs du run précédent : rejoués, même s'ils sont derrière le watermark
+    failed = set(checkpoint["failed"])
+    max_ahead = concurrency * MAX_AHEAD_FACTOR
+
+    stats = {"skipped": 0, "success": 0, "error": 0}
+    in_flight = {}
+
+    def advance_watermark():
+        nonlocal watermark
+        while watermark in done:
+            done.discard(watermark)
+            watermark += 1
+
+    def settle(line_no: int, result: dict, out) -> None:
+        success = result.get("status") == "success"
+        stats["success" if success else "error"] += 1
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        # Une ligne en échec est réglée pour le watermark mais gardée pour la reprise
+        (failed.discard if success else failed.add)(line_no)
+        if line_no >= watermark:
+            done.add(line_no)
+
+    def collect(futures, out):
+        for future in futures:
+            line_no, record_id = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"id": record_id, "line": line_no, "status": "error", "message": str(e)}
+            settle(line_no, result, out)
+        advance_watermark()
+        _save_checkpoint(checkpoint_path, watermark, done, failed)
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for line_no, record in _iter_records(input_path):
+            if (line_no < watermark or line_no in done) and line_no not in failed:
+                stats["skipped"] += 1
+                continue
+            if record is None:
+                # Ligne vide : rien à planifier, mais elle doit faire avancer le watermark
+                done.add(line_no)
+                advance_watermark()
+                continue
+            if isinstance(record, Exception) or not isinstance(record, dict) or "constraints" not in record:
+                # Ligne invalide : erreur définitive, inutile de la rejouer
+                message = str(record) if isinstance(record, Exception) else "enregistrement sans 'constraints'"
+                record_id = record.get("id", line_no) if isinstance(record, dict) else line_no
+                settle(line_no, {"id": record_id, "line": line_no, "status": "error", "message": message}, out)
+                failed.discard(line_no)
+                advance_watermark()
+                continue
+
+            while in_flight and (len(in_flight) >= concurrency or line_no - watermark >= max_ahead):
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished, out)
+
+            in_flight[pool.submit(_plan_record, line_no, record)] = (line_no, record.get("id", line_no))
+
+        if in_flight:
+            finished, _ = wait(in_flight)
+            collect(finished, out)
+
+    _save_checkpoint(checkpoint_path, watermark, done, failed)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération de menus hebdomadaires en batch (JSONL).")
+    parser.add_argument("input", help="Fichier JSONL de contraintes ({'id': ..., 'constraints': ...})")
+    parser.add_argument("output", help="Fichier JSONL de sortie (ouvert en ajout)")
+    parser.add_argument("--checkpoint", default=None, help="Chemin du checkpoint (défaut : <output>.ckpt)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Nombre de menus planifiés en parallèle")
+    args = parser.parse_args()
+
+    print(f"ChefBot planifie les menus de {args.input}...")
+    stats = run_batch(args.input, args.output, args.checkpoint, args.concurrency)
+    print(f"Terminé : {stats['success']} succès, {stats['error']} erreurs, {stats['skipped']} déjà traités.")
+    print(f"Pool HTTP : {gateway.stats()}")
+    get_client().flush()
@@ -1,34 +1,41 @@
 import os
 from typing import Any
 from dotenv import load_dotenv
-from groq import Groq
 from litellm import api_key
 import litellm
-from smolagents import CodeAgent, LiteLLMModel
 from langfuse import get_client, observe
 import json
 from smolagents import tool
+from llm_gateway import gateway
+from code_format import CodeFormatNormalizer
+from agent_budget import RunBudget, run_with_budget
+from seasonal_produce import resolve_seasonal, format_seasonal, skip_seasonal_steps
+from sandbox_pool import SandboxedCodeAgent
+from tool_output import MAX_OUTPUT_CHARS, paginate, format_table, fit_page, bound_output
 
 load_dotenv()
 langfuse_client = get_client() 
 groq_api_key = os.getenv("GROQ_API_KEY")
 
-model = LiteLLMModel(
+model = CodeFormatNormalizer(gateway.litellm_model(
     model_id="groq/meta-llama/llama-4-scout-17b-16e-instruct",
     api_key=groq_api_key
-)
+))
 
-groq_client = Groq(api_key=groq_api_key)
+groq_client = gateway.groq_client(api_key=groq_api_key)
 
 #Partie 1 :
 
 @observe(name="ChefBot")
 def ask_chef(question: str) -> str:
 
+    # La saison est résolue localement : le prompt porte directement la liste des produits
+    seasonal = resolve_seasonal(question)
+
     langfuse_client.update_current_trace(
         metadata={
             "type": "Groupe Clement et Baptiste, Partie 1",
-            "season": "Hiver"
+            "season": seasonal["label"]
         },
     )
 
@@ -40,7 +47,8 @@ def ask_chef(question: str) -> str:
                 "content": (
                     "Tu es ChefBot, un grand chef cuisinier français spécialisé en cuisine de saison. "
                     "Ton expertise porte sur les produits frais du terroir. "
-                    "Réponds avec élégance et conseille toujours des ingrédients de saison."
+                    "Réponds avec élégance et conseille toujours des ingrédients de saison.\n"
+                    f"{format_seasonal(seasonal)}"
                 )
             },
             {"role": "user", "content": question}
@@ -95,14 +103,15 @@ def plan_weekly_menu(constraints: str) -> dict:
     )
 
     try:
-        plan = planification_menu(constraints)
+        seasonal = format_seasonal(resolve_seasonal(constraints))
+        plan = planification_menu(constraints, seasonal)
 
         step_results = []
-        for i, step in enumerate(plan["steps"]):
-            result = execution_menu(step, i, context=step_results)
+        for i, step in enumerate(skip_seasonal_steps(plan["steps"])):
+            result = execution_menu(step, i, context=step_results, seasonal=seasonal)
             step_results.append(result)
 
-        final_menu = synthese_menu(constraints, step_results)
+        final_menu = synthese_menu(constraints, step_results, seasonal)
 
         return {
             "status": "success",
@@ -117,13 +126,14 @@ def plan_weekly_menu(constraints: str) -> dict:
         return {"status": "error", "error": str(e)}
 
 @observe(name="planification_menu", as_type="generation")
-def planification_menu(constraints: str, retry: bool = False) -> dict:
+def planification_menu(constraints: str, seasonal: str = "", retry: bool = False) -> dict:
     system_prompt = (
         "Tu es l'assistant de planification de ChefBot. Décompose la création d'un menu complet "
-        "(Petit-déjeuner, Déjeuner, Dîner) en 3 étapes logiques. "
+        "(Petit-déjeuner, Déjeuner, Dîner) en 3 étapes logiques au plus. "
+        "Les produits de saison sont fournis : ne crée pas d'étape pour les identifier. "
         "Réponds UNIQUEMENT en JSON."
     )
-    user_content = f"Contraintes : {constraints}. \nFormat: {{'steps': ['étape 1', 'étape 2', ...], 'reasoning': '...'}}"
+    user_content = f"Contraintes : {constraints}. \n{seasonal}\nFormat: {{'steps': ['étape 1', 'étape 2', ...], 'reasoning': '...'}}"
     
     response_text = call_groq(system_prompt, user_content, json_mode=True)
     
@@ -137,7 +147,7 @@ def planification_menu(constraints: str, retry: bool = False) -> dict:
     except (json.JSONDecodeError, ValueError) as e:
         if not retry:
             print(f"Erreur JSON détectée. Tentative de Retry...")
-            return planification_menu(constraints, retry=True)
+            return planification_menu(constraints, seasonal, retry=True)
         else:
             langfuse_client.update_current_span(
                 level="ERROR",
@@ -147,28 +157,28 @@ def planification_menu(constraints: str, retry: bool = False) -> dict:
             raise e
 
 @observe(name="execution_menu")
-def execution_menu(step: str, index: int, context: list) -> dict:
+def execution_menu(step: str, index: int, context: list, seasonal: str = "") -> dict:
     context_str = "\n".join([f"- {r['output']}" for r in context]) if context else "Aucun historique."
     
     system_prompt = (
         "Tu es ChefBot, expert en cuisine de saison. Exécute précisément l'étape demandée "
         "en tenant compte du travail déjà effectué précédemment."
     )
-    user_content = f"Historique du menu :\n{context_str}\n\nÉtape à réaliser : {step}"
+    user_content = f"{seasonal}\nHistorique du menu :\n{context_str}\n\nÉtape à réaliser : {step}"
     
     output = call_groq(system_prompt, user_content)
     
     return {"step": step, "index": index, "output": output}
 
 @observe(name="synthese-phase", as_type="generation")
-def synthese_menu(constraints: str, results: list) -> str:
+def synthese_menu(constraints: str, results: list, seasonal: str = "") -> str:
     results_text = "\n\n".join([f"Phase {r['index']+1} ({r['step']}) : {r['output']}" for r in results])
     
     system_prompt = (
         "Tu es ChefBot. Compile les réflexions précédentes en un menu hebdomadaire structuré, "
         "élégant et respectant les contraintes de saison."
     )
-    user_content = f"Contraintes : {constraints}\n\nTravail préparatoire :\n{results_text}"
+    user_content = f"Contraintes : {constraints}\n{seasonal}\n\nTravail préparatoire :\n{results_text}"
     
     return call_groq(system_prompt, user_content)
 
@@ -208,11 +218,15 @@ DIETARY_INFO = {
 # Outils
 
 @tool
-def check_fridge():
+def check_fridge(limit: int = None, offset: int = 0) -> str:
     """
-    Retourne une liste d'ingrédients disponibles dans le frigo.
+    Retourne une liste d'ingrédients disponibles dans le frigo (paginée).
+    Args:
+        limit: Nombre maximum d'ingrédients renvoyés (défaut : 10).
+        offset: Position du premier ingrédient renvoyé, pour la page suivante.
     """
-    return ", ".join(FRIDGE_CONTENT)
+    page, total = paginate(FRIDGE_CONTENT, limit, offset)
+    return fit_page(page, total, offset, ", ".join, sep=" ")
 
 @tool
 def get_recipe(dish_name: str) -> str:
@@ -236,7 +250,7 @@ def check_dietary_info(ingredient: str) -> str:
     """
     info = DIETARY_INFO.get(ingredient.lower())
     if info:
-        return f"Infos pour {ingredient}: {info}"
+        return bound_output(format_table([{"ingredient": ingredient, **info}], ["ingredient", "calories", "allergenes"]))
     return f"Pas d'infos pour {ingredient}"
 
 tools = [
@@ -244,8 +258,14 @@ tools = [
         "type": "function",
         "function": {
             "name": "check_fridge",
-            "description": "Retourne une liste d'ingrédients disponibles dans le frigo",
-            "parameters": {"type": "object", "properties": {}}
+            "description": "Retourne une liste d'ingrédients disponibles dans le frigo (paginée)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "limit": {"type": "integer", "description": "Nombre maximum d'ingrédients"},
+                    "offset": {"type": "integer", "description": "Position du premier ingrédient"}
+                }
+            }
         }
     },
     {
@@ -369,11 +389,13 @@ def partie_4_manuel():
 
 #partie_4_manuel()
 
-agent = CodeAgent(
+# Le code généré s'exécute dans un worker préforké (limites CPU/mémoire), pas dans ce process
+agent = SandboxedCodeAgent(
     tools=[check_fridge, get_recipe, check_dietary_info], 
     model=model,
     add_base_tools=False,
-    max_steps=5
+    max_steps=5,
+    max_print_outputs_length=MAX_OUTPUT_CHARS
 )
 
 def partie_4_smolagent():
@@ -383,20 +405,22 @@ def partie_4_smolagent():
 
     # Example 1: Simple tool call (Vérification du stock)
     print("\n--- Example 1: Inventory Check ---")
-    answer = agent.run("Quels sont les ingrédients disponibles dans le frigo ?")
+    answer = run_with_budget(agent, "Quels sont les ingrédients disponibles dans le frigo ?", RunBudget(deadline_s=60, max_tokens=20000))
     print(f"\nAnswer: {answer}")
 
     # Example 2: Multiple tool calls (Frigo + Recette + Diététique)
     print("\n--- Example 2: Complex Chain (Fridge + Recipe) ---")
-    answer = agent.run(
+    answer = run_with_budget(
+        agent,
         "Regarde ce qu'il y a dans le frigo. Est-ce que je peux faire une salade caprese ? "
-        "Si oui, donne-moi la recette et dis-moi si le fromage est calorique."
+        "Si oui, donne-moi la recette et dis-moi si le fromage est calorique.",
+        RunBudget(deadline_s=60, max_tokens=20000)
     )
     print(f"\nAnswer: {answer}")
 
     # Example 3: Specific Query (Dietary Info)
     print("\n--- Example 3: Specific Tool (Dietary Info) ---")
-    answer = agent.run("Quelles sont les informations nutritionnelles pour les oeufs ?")
+    answer = run_with_budget(agent, "Quelles sont les informations nutritionnelles pour les oeufs ?", RunBudget(deadline_s=60, max_tokens=20000))
     print(f"\nAnswer: {answer}")
 
 partie_4_smolagent()
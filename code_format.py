@@ -0,0 +1,110 @@
+import re
+import ast
+import threading
+from smolagents.utils import parse_code_blobs
+
+# NORMALISATION DU FORMAT DE CODE (CodeAgent)
+#
+# Le modèle envoie souvent ```python ... au lieu de <code>...</code> (voir le
+# step 1 du run de la partie 5). smolagents rejette alors la réponse avec
+# "Error in code parsing" et relance un tour complet du LLM. On récupère ici
+# les variantes courantes localement, avant le parsing de l'agent.
+
+FENCE_OPEN = re.compile(r"```(?:python|py)?[ \t]*\n")
+CODE_PREFIX = re.compile(r"^[ \t]*Code\s*:[ \t]*\n?", re.MULTILINE)
+
+
+def _is_valid_python(code: str) -> bool:
+    try:
+        ast.parse(code)
+        return True
+    except SyntaxError:
+        return False
+
+
+def normalize_code_blob(text: str, code_block_tags: tuple = ("<code>", "</code>")):
+    """
+    Réécrit une réponse mal formatée en "<pensée>\\n<code>\\n...\\n</code>".
+    Retourne None si la réponse est déjà parsable par smolagents, ou si le
+    code ne peut pas être récupéré (l'agent produira alors son erreur habituelle).
+    """
+    open_tag, close_tag = code_block_tags
+    # L'agent ajoute lui-même la balise fermante quand elle manque (stop sequence)
+    candidate = text if text.strip().endswith(close_tag) else text + close_tag
+    try:
+        parse_code_blobs(candidate, code_block_tags)
+        return None
+    except ValueError:
+        pass
+
+    fence = FENCE_OPEN.search(text)
+    tag_start = text.find(open_tag)
+    prefix = CODE_PREFIX.search(text)
+
+    if fence:
+        thought, code = text[: fence.start()], text[fence.end():]
+    elif tag_start != -1:
+        thought, code = text[:tag_start], text[tag_start + len(open_tag):]
+    elif prefix:
+        thought, code = text[: prefix.end()], text[prefix.end():]
+    else:
+        return None
+
+    # Le bloc se termine au premier marqueur de fin, quel qu'il soit
+    for end_marker in (close_tag, "\n```", "```"):
+        if end_marker in code:
+            code = code[: code.index(end_marker)]
+    code = code.strip()
+
+    if not code or not _is_valid_python(code):
+        return None
+    return f"{thought.rstrip()}\n{open_tag}\n{code}\n{close_tag}"
+
+
+# Texte fixe du message d'erreur de parsing de smolagents ("Your code snippet is
+# invalid... Make sure to include code with the correct pattern..."), en tokens
+PARSE_ERROR_OVERHEAD_TOKENS = 80
+
+
+class CodeFormatNormalizer:
+    """
+    Enveloppe un modèle smolagents : les sorties des étapes de code sont
+    normalisées avant d'arriver au parser du CodeAgent. Les autres appels
+    (planification, réponse finale forcée) passent sans modification.
+    """
+
+    def __init__(self, model, code_block_tags: tuple = ("<code>", "</code>")):
+        self.model = model
+        self.code_block_tags = code_block_tags
+        self._lock = threading.Lock()
+        self.stats = {"recovered_steps": 0, "est_retry_input_tokens": 0, "est_retry_output_tokens": 0}
+
+    def generate(self, messages, stop_sequences=None, **kwargs):
+        chat_message = self.model.generate(messages, stop_sequences=stop_sequences, **kwargs)
+        # Seules les étapes de code utilisent la balise fermante comme stop sequence
+        if stop_sequences and self.code_block_tags[1] in stop_sequences and chat_message.content:
+            normalized = normalize_code_blob(chat_message.content, self.code_block_tags)
+            if normalized is not None:
+                chat_message.content = normalized
+                self._record_saving(chat_message.token_usage)
+        return chat_message
+
+    def _record_saving(self, token_usage) -> None:
+        # Sans normalisation, l'appel suivant aurait renvoyé tout l'historique, plus
+        # la sortie ratée et le message d'erreur qui la recopie : c'est ce coût
+        # (estimé) qui est évité, pas celui de l'appel qu'on vient de récupérer
+        with self._lock:
+            self.stats["recovered_steps"] += 1
+            if token_usage is not None:
+                self.stats["est_retry_input_tokens"] += (
+                    token_usage.input_tokens + 2 * token_usage.output_tokens + PARSE_ERROR_OVERHEAD_TOKENS
+                )
+                self.stats["est_retry_output_tokens"] += token_usage.output_tokens
+
+    def __call__(self, *args, **kwargs):
+        return self.generate(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import httpx
+import litellm
+from dotenv import load_dotenv
+from groq import Groq
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+from smolagents import LiteLLMModel
+from agent_budget import BudgetRetrying
+
+load_dotenv()
+
+# PASSERELLE LLM PARTAGÉE
+#
+# Un seul pool de connexions HTTP (keep-alive réglé) pour tous les appels :
+# le client Groq brut (chefbot, partie2, partie3) et les LiteLLMModel de
+# smolagents (partie5, partie6). Les connexions TCP/TLS sont réutilisées
+# d'un appel à l'autre au lieu d'être rouvertes à chaque requête.
+
+
+class PoolMetrics:
+    """Métriques du pool, alimentées par les événements de trace httpcore."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.queue_wait_s = 0.0
+        self.max_queue_wait_s = 0.0
+        self.connect_s = 0.0
+        self.tls_s = 0.0
+
+    def record(self, request_metrics: dict) -> None:
+        with self._lock:
+            self.requests += 1
+            if request_metrics.get("error"):
+                self.errors += 1
+            if "connect_s" in request_metrics:
+                self.connections_opened += 1
+                self.connect_s += request_metrics["connect_s"]
+                self.tls_s += request_metrics.get("tls_s", 0.0)
+            elif not request_metrics.get("error"):
+                self.connections_reused += 1
+            wait = request_metrics.get("queue_wait_s", 0.0)
+            self.queue_wait_s += wait
+            self.max_queue_wait_s = max(self.max_queue_wait_s, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            opened = self.connections_opened
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "connections_opened": opened,
+                "connections_reused": self.connections_reused,
+                "reuse_ratio": round(self.connections_reused / self.requests, 3) if self.requests else 0.0,
+                "avg_queue_wait_ms": round(1000 * self.queue_wait_s / self.requests, 2) if self.requests else 0.0,
+                "max_queue_wait_ms": round(1000 * self.max_queue_wait_s, 2),
+                # httpcore résout le DNS dans connect_tcp : ce temps inclut DNS + TCP
+                "avg_connect_ms": round(1000 * self.connect_s / opened, 2) if opened else 0.0,
+                "avg_tls_ms": round(1000 * self.tls_s / opened, 2) if opened else 0.0,
+            }
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """Transport httpx qui attache un callback de trace httpcore à chaque requête."""
+
+    def __init__(self, metrics: PoolMetrics, **kwargs):
+        super().__init__(**kwargs)
+        self.metrics = metrics
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        marks = {}
+        request_metrics = {}
+
+        def trace(event_name: str, info: dict) -> None:
+            now = time.perf_counter()
+            # Premier événement réseau = fin de l'attente d'une connexion libre dans le pool
+            if "queue_wait_s" not in request_metrics and (
+                event_name.startswith("connection.connect_tcp") or event_name.endswith("send_request_headers.started")
+            ):
+                request_metrics["queue_wait_s"] = now - start
+            if event_name.endswith(".started"):
+                marks[event_name[: -len(".started")]] = now
+            elif event_name.endswith(".complete"):
+                step = event_name[: -len(".complete")]
+                if step == "connection.connect_tcp":
+                    request_metrics["connect_s"] = now - marks.get(step, now)
+                elif step == "connection.start_tls":
+                    request_metrics["tls_s"] = now - marks.get(step, now)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            return super().handle_request(request)
+        except Exception:
+            request_metrics["error"] = True
+            raise
+        finally:
+            self.metrics.record(request_metrics)
+
+
+class _PooledLiteLLM:
+    """Remplace le module `litellm` comme client d'un LiteLLMModel pour imposer le handler HTTP du pool."""
+
+    def __init__(self, http_handler: HTTPHandler):
+        self.http_handler = http_handler
+
+    def completion(self, **kwargs):
+        return litellm.completion(client=self.http_handler, **kwargs)
+
+
+class LLMGateway:
+    """
+    Point d'entrée unique vers les LLM : pool de connexions partagé,
+    timeouts et retries configurables, métriques du pool.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 120.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        retries: int = 2,
+    ):
+        self.retries = retries
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.metrics = PoolMetrics()
+        transport = _MeteredTransport(
+            self.metrics,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            # retries au niveau transport = erreurs de connexion uniquement
+            retries=retries,
+        )
+        self.http_client = httpx.Client(transport=transport, timeout=self.timeout)
+        self._litellm_client = _PooledLiteLLM(HTTPHandler(client=self.http_client))
+        self._groq_clients = {}
+        self._lock = threading.Lock()
+
+        # Fournisseurs LiteLLM qui passent par le SDK OpenAI : même pool
+        litellm.client_session = self.http_client
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        return cls(
+            max_connections=int(os.getenv("CHEFBOT_HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("CHEFBOT_HTTP_MAX_KEEPALIVE", "10")),
+            connect_timeout=float(os.getenv("CHEFBOT_HTTP_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("CHEFBOT_HTTP_TIMEOUT", "60")),
+            retries=int(os.getenv("CHEFBOT_HTTP_RETRIES", "2")),
+        )
+
+    def groq_client(self, api_key: str = None) -> Groq:
+        """Client Groq partagé (un par clé d'API), branché sur le pool."""
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+        with self._lock:
+            if api_key not in self._groq_clients:
+                self._groq_clients[api_key] = Groq(
+                    api_key=api_key,
+                    http_client=self.http_client,
+                    timeout=self.timeout,
+                    # retries du SDK = 429 / 5xx, avec backoff
+                    max_retries=self.retries,
+                )
+            return self._groq_clients[api_key]
+
+    def litellm_model(self, model_id: str, **kwargs) -> LiteLLMModel:
+        """LiteLLMModel smolagents dont les requêtes passent par le pool."""
+        model = LiteLLMModel(
+            model_id=model_id,
+            client=self._litellm_client,
+            timeout=self.timeout.read,
+            **kwargs,
+        )
+        # Les 429 sont retentés (avec backoff) par le retryer de smolagents ; pendant un
+        # run_with_budget, délai et retries sont bornés par la deadline du budget
+        model.retryer = BudgetRetrying(model.retryer)
+        return model
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot()
+
+
+gateway = LLMGateway.from_env()
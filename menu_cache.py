@@ -0,0 +1,216 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+from datetime import datetime
+
+# CACHE DE MENUS PAR SIMILARITÉ
+#
+# Les contraintes sont ramenées à des facettes canoniques (régime, budget,
+# nombre de personnes, saison, allergènes) + les mots restants. Deux demandes
+# comme "Végétarien, budget 60€" et "végétarien budget 60 euros" donnent les
+# mêmes facettes et réutilisent le même menu. Tout est local : pas de service
+# d'embeddings.
+
+DIETS = {
+    "vegan": ["vegan", "vegane", "vegetalien"],
+    "vegetarien": ["vegetarien", "vegetarienne", "vege", "veggie"],
+    "sans gluten": ["sans gluten", "gluten free", "coeliaque"],
+    "sans lactose": ["sans lactose", "pas de produits laitiers", "sans produits laitiers"],
+    "diabetique": ["diabetique", "diabete"],
+    "proteine": ["proteine", "proteines", "sportif", "musculation"],
+    "halal": ["halal"],
+}
+
+ALLERGENS = {
+    "gluten": ["gluten"],
+    "lait": ["lactose", "produits laitiers", "lait"],
+    "arachide": ["arachide", "arachides", "cacahuete"],
+    "fruits a coque": ["fruits a coque", "noix", "noisette"],
+    "oeuf": ["oeuf", "oeufs"],
+    "soja": ["soja"],
+    "poisson": ["poisson"],
+    "crustaces": ["crustace", "crustaces", "fruits de mer"],
+}
+
+SEASONS = {
+    "hiver": ["hiver", "decembre", "janvier", "fevrier"],
+    "printemps": ["printemps", "mars", "avril", "mai"],
+    "ete": ["ete", "juin", "juillet", "aout"],
+    "automne": ["automne", "septembre", "octobre", "novembre"],
+}
+
+STOPWORDS = {
+    "de", "du", "des", "la", "le", "les", "un", "une", "et", "pour", "avec", "en",
+    "a", "au", "aux", "par", "sur", "menu", "repas", "semaine", "uniquement",
+    "budget", "euros", "euro", "eur", "personnes", "personne", "pers", "convives",
+    "famille", "regime", "saison", "focus", "ingredients", "ni", "allergie",
+    "allergique", "sans", "pas", "petit", "serre", "limite", "reduit",
+}
+
+# Poids de chaque facette dans le score de similarité. Régime, allergènes et
+# nombre de personnes sont aussi des clés de regroupement (voir MenuPlanCache).
+# Chaque poids dépasse 1 - seuil par défaut (0.9) : une seule facette
+# différente (saison, budget, mots restants) suffit à rater le cache.
+WEIGHTS = {"diet": 0.2, "allergens": 0.2, "budget": 0.2, "season": 0.15, "extra": 0.25}
+
+
+def normalize(text: str) -> str:
+    """Minuscules, sans accents ni ponctuation, "œ" -> "oe"."""
+    text = text.lower().replace("œ", "oe")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"(\d),(\d)", r"\1.\2", text)
+    text = re.sub(r"[^a-z0-9.,€ ]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _match_labels(text: str, table: dict) -> set:
+    return {label for label, variants in table.items()
+            if any(re.search(rf"\b{re.escape(v)}\b", text) for v in variants)}
+
+
+def parse_constraints(constraints: str) -> dict:
+    """Extrait les facettes canoniques d'une chaîne de contraintes."""
+    text = normalize(constraints)
+
+    diet = _match_labels(text, DIETS)
+    # "sans gluten" est à la fois un régime et un allergène : on garde les deux
+    allergens = {label for label, variants in ALLERGENS.items()
+                 if any(re.search(rf"\b(sans|pas de|allergi\w*)\b[^,]*\b{re.escape(v)}\b", text) for v in variants)}
+
+    budget = None
+    match = re.search(r"(\d+(?:\.\d+)?) ?(?:€|(?:euros?|eur)\b)", text)
+    if match:
+        budget = float(match.group(1))
+    elif re.search(r"\bbudget (serre|limite|reduit)\b|\bpetit budget\b", text):
+        budget = "serre"
+
+    people = None
+    match = re.search(r"(\d+) ?(?:personnes?|pers|convives?|adultes?)\b|famille de (\d+)", text)
+    if match:
+        people = int(match.group(1) or match.group(2))
+
+    season = next(iter(_match_labels(text, SEASONS)), None)
+
+    # Seuls les mots devenus facettes sortent de "extra" ("riche en poisson" garde "poisson")
+    matched = [(DIETS, diet), (ALLERGENS, allergens), (SEASONS, {season} if season else set())]
+    known = set()
+    for table, labels in matched:
+        for label in labels:
+            for v in table[label]:
+                if re.search(rf"\b{re.escape(v)}\b", text):
+                    known.update(v.split())
+    extra = {w for w in re.findall(r"[a-z]+", text)
+             if w not in STOPWORDS and w not in known}
+
+    return {
+        "diet": sorted(diet),
+        "allergens": sorted(allergens),
+        "budget": budget,
+        "people": people,
+        "season": season,
+        "extra": sorted(extra),
+    }
+
+
+def _jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _budget_similarity(a, b) -> float:
+    if a is None and b is None:
+        return 1.0
+    if a is None or b is None or isinstance(a, str) or isinstance(b, str):
+        return 1.0 if a == b else 0.0
+    # 60€ et 62€ sont quasiment la même contrainte, 60€ et 120€ non
+    return max(0.0, 1.0 - abs(a - b) / max(a, b) * 5)
+
+
+def similarity(facets_a: dict, facets_b: dict) -> float:
+    scores = {
+        "diet": _jaccard(facets_a["diet"], facets_b["diet"]),
+        "allergens": _jaccard(facets_a["allergens"], facets_b["allergens"]),
+        "budget": _budget_similarity(facets_a["budget"], facets_b["budget"]),
+        "season": 1.0 if facets_a["season"] == facets_b["season"] else 0.0,
+        "extra": _jaccard(facets_a["extra"], facets_b["extra"]),
+    }
+    return sum(WEIGHTS[k] * v for k, v in scores.items())
+
+
+class MenuPlanCache:
+    """
+    Cache de résultats de `plan_weekly_menu` indexé par facettes.
+    L'index est regroupé par (régime, allergènes, personnes, scope) : une
+    recherche ne compare que les menus qui partagent déjà ces facettes
+    obligatoires. `scope` porte le contexte résolu hors contraintes (ex : la
+    liste de produits du mois courant, voir partie2.py).
+    """
+
+    def __init__(self, threshold: float = 0.9, path: str = None, namespace: str = ""):
+        self.threshold = threshold
+        self.path = path
+        # Les entrées persistées sous un autre espace de noms (anciens prompts) sont ignorées
+        self.namespace = namespace
+        self._index = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry.get("namespace", "") == namespace:
+                            self._add(entry)
+
+    @staticmethod
+    def _bucket(facets: dict, scope: str) -> tuple:
+        return tuple(facets["diet"]), tuple(facets["allergens"]), facets["people"], scope
+
+    def _add(self, entry: dict) -> None:
+        self._index.setdefault(self._bucket(entry["facets"], entry.get("scope", "")), []).append(entry)
+
+    def lookup(self, constraints: str, scope: str = ""):
+        """Retourne (entrée, similarité) du meilleur menu au-dessus du seuil, sinon None."""
+        facets = parse_constraints(constraints)
+        with self._lock:
+            candidates = list(self._index.get(self._bucket(facets, scope), []))
+
+        best, best_score = None, 0.0
+        for entry in candidates:
+            score = similarity(facets, entry["facets"])
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is None or best_score < self.threshold:
+            return None
+        return best, best_score
+
+    def store(self, constraints: str, menu: str, scope: str = "") -> None:
+        entry = {
+            "constraints": constraints,
+            "facets": parse_constraints(constraints),
+            "scope": scope,
+            "menu": menu,
+            "namespace": self.namespace,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._lock:
+            self._add(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def provenance(entry: dict, score: float) -> dict:
+        """Métadonnées de trace pour un menu servi depuis le cache."""
+        return {
+            "hit": True,
+            "similarity": round(score, 3),
+            "source_constraints": entry["constraints"],
+            "source_facets": entry["facets"],
+            "cached_at": entry["created_at"],
+        }
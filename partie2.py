@@ -1,34 +1,86 @@
 import os
 import json
 from dotenv import load_dotenv
-from groq import Groq
+from llm_gateway import gateway
 from langfuse import observe, get_client
+from menu_cache import MenuPlanCache
+from result_store import make_key, code_version
+from seasonal_produce import resolve_seasonal, format_seasonal, skip_seasonal_steps, produce_fingerprint
 
 load_dotenv()
 
-groq_client = Groq()
+groq_client = gateway.groq_client()
 langfuse = get_client()
 
+# PROMPTS ET MODÈLES (leur empreinte sert de clé de cache, voir partie3.py)
+
+# Version de la logique du pipeline : le code de ce fichier hors prompts/modèles/paramètres
+# des étapes, qui ont chacun leur empreinte (modifier un prompt ne recalcule que son étape
+# et les suivantes)
+PIPELINE_VERSION = code_version(
+    __file__, "STAGES", "PLANNER_MODEL", "PLANNER_PROMPT", "EXECUTOR_MODEL", "EXECUTOR_PROMPT",
+    "SYNTHESIZER_MODEL", "SYNTHESIZER_PROMPT",
+)
+
+PLANNER_MODEL = "openai/gpt-oss-120b"
+PLANNER_PROMPT = """Tu es un planificateur culinaire expert. 
+Décompose la création d'un menu hebdomadaire selon ces contraintes : {constraints}.
+{seasonal} Ces produits sont déjà identifiés : ne crée pas d'étape pour les rechercher.
+Génère au plus 3 étapes concrètes (ex: 'identifier les protéines', 'composer les plats', 'équilibrer les repas').
+
+RETOURNE UNIQUEMENT DU JSON au format suivant :
+{{
+    "steps": ["étape 1", "étape 2", "étape 3"],
+    "reasoning": "explication courte"
+}}"""
+
+EXECUTOR_MODEL = "llama-3.3-70b-versatile"
+EXECUTOR_PROMPT = """Exécute cette étape : {step_description}
+{seasonal}
+Contexte précédent : {context_str}"""
+
+SYNTHESIZER_MODEL = "llama-3.3-70b-versatile"
+SYNTHESIZER_PROMPT = """Synthétise un menu hebdomadaire basé sur : {constraints}.
+{seasonal}
+Résultats des étapes : {all_work}"""
+
+STAGES = {
+    "planner": {"model": PLANNER_MODEL, "temperature": 0.3, "prompt": PLANNER_PROMPT},
+    "executor": {"model": EXECUTOR_MODEL, "temperature": 0.7, "prompt": EXECUTOR_PROMPT},
+    "synthesizer": {"model": SYNTHESIZER_MODEL, "temperature": 0.5, "prompt": SYNTHESIZER_PROMPT},
+}
+
+
+def pipeline_fingerprint(stage: str = None) -> str:
+    """
+    Empreinte des prompts/modèles de `stage` et des étapes en amont (toutes par
+    défaut) + version de la logique et table des produits de saison.
+    """
+    order = list(STAGES)
+    stages = order[:order.index(stage) + 1] if stage else order
+    return make_key(PIPELINE_VERSION, {s: STAGES[s] for s in stages}, produce_fingerprint())[:16]
+
+
+# Cache de menus par similarité (voir menu_cache.py), persisté si CHEFBOT_CACHE_PATH est défini.
+# L'espace de noms évite de resservir des menus produits par d'anciens prompts.
+menu_cache = MenuPlanCache(
+    threshold=float(os.getenv("CHEFBOT_CACHE_THRESHOLD", "0.9")),
+    path=os.getenv("CHEFBOT_CACHE_PATH"),
+    namespace=pipeline_fingerprint(),
+)
+
 # FONCTIONS DE SOUS-ÉTAPES
 
 @observe(name="planning", as_type="generation")
-def _plan_steps(constraints: str, retry: bool = True) -> dict:
+def _plan_steps(constraints: str, seasonal: str = "", retry: bool = True) -> dict:
     """Étape 1 : Planification"""
     
-    prompt = f"""Tu es un planificateur culinaire expert. 
-    Décompose la création d'un menu hebdomadaire selon ces contraintes : {constraints}.
-    Génère 3 étapes concrètes (ex: 'identifier les protéines', 'choisir les légumes', 'équilibrer les repas').
-    
-    RETOURNE UNIQUEMENT DU JSON au format suivant :
-    {{
-        "steps": ["étape 1", "étape 2", "étape 3"],
-        "reasoning": "explication courte"
-    }}"""
+    prompt = PLANNER_PROMPT.format(constraints=constraints, seasonal=seasonal)
 
     response = groq_client.chat.completions.create(
-        model="openai/gpt-oss-120b",
+        model=PLANNER_MODEL,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
+        temperature=STAGES["planner"]["temperature"],
         response_format={"type": "json_object"}
     )
 
@@ -42,7 +94,7 @@ def _plan_steps(constraints: str, retry: bool = True) -> dict:
                 level="ERROR",
                 status_message=f"JSON invalide, retry en cours... {str(e)}"
             )
-            return _plan_steps(constraints, retry=False)
+            return _plan_steps(constraints, seasonal, retry=False)
         else:
             get_client().update_current_span(
                 level="ERROR",
@@ -51,18 +103,17 @@ def _plan_steps(constraints: str, retry: bool = True) -> dict:
             raise e
 
 @observe(name="execute-step", as_type="generation")
-def _execute_step(step_description: str, step_index: int, previous_results: list) -> dict:
+def _execute_step(step_description: str, step_index: int, previous_results: list, seasonal: str = "") -> dict:
     """Étape 2 : Exécution d'une étape spécifique"""
     
     context_str = "\n".join([f"- {r['output']}" for r in previous_results]) if previous_results else "Aucun"
     
-    prompt = f"""Exécute cette étape : {step_description}
-    Contexte précédent : {context_str}"""
+    prompt = EXECUTOR_PROMPT.format(step_description=step_description, seasonal=seasonal, context_str=context_str)
 
     response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+        model=EXECUTOR_MODEL,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.7
+        temperature=STAGES["executor"]["temperature"]
     )
 
     return {
@@ -71,18 +122,17 @@ def _execute_step(step_description: str, step_index: int, previous_results: list
     }
 
 @observe(name="synthesis", as_type="generation")
-def _synthesize_menu(constraints: str, results: list) -> str:
+def _synthesize_menu(constraints: str, results: list, seasonal: str = "") -> str:
     """Étape 3 : Synthèse finale"""
     
     all_work = "\n\n".join([f"RÉSULTAT {r['step']} :\n{r['output']}" for r in results])
     
-    prompt = f"""Synthétise un menu hebdomadaire basé sur : {constraints}.
-    Résultats des étapes : {all_work}"""
+    prompt = SYNTHESIZER_PROMPT.format(constraints=constraints, seasonal=seasonal, all_work=all_work)
 
     response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+        model=SYNTHESIZER_MODEL,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0.5
+        temperature=STAGES["synthesizer"]["temperature"]
     )
 
     return response.choices[0].message.content
@@ -90,24 +140,57 @@ def _synthesize_menu(constraints: str, results: list) -> str:
 # FONCTION PRINCIPALE
 
 
+def _memo(store, stage: str, inputs, compute):
+    """Mémoïse une étape sous (entrées, empreinte de l'étape) si un store est fourni."""
+    if store is None:
+        return compute()
+    return store.get_or_compute(make_key(stage, inputs, pipeline_fingerprint(stage)), compute)
+
+
 @observe(name="plan_weekly_menu")
-def plan_weekly_menu(constraints: str) -> dict:
-    """Orchestration du menu"""
+def plan_weekly_menu(constraints: str, store=None) -> dict:
+    """
+    Orchestration du menu.
+    Avec `store` (ResultStore), chaque étape est rejouée depuis le disque tant que
+    ses entrées et son prompt/modèle n'ont pas changé ; le cache par similarité
+    est alors ignoré pour que le menu corresponde exactement aux contraintes.
+    """
     
+    # Produits de saison résolus localement : pas d'étape LLM pour les identifier.
+    # Sans mois explicite, la liste dépend du mois courant : elle sert aussi de
+    # portée au cache (un menu d'octobre n'est pas resservi en février).
+    seasonal = format_seasonal(resolve_seasonal(constraints))
+    cached = menu_cache.lookup(constraints, scope=seasonal) if store is None else None
+
     get_client().update_current_trace(
         tags=["Groupe Baptiste_Clement", "Partie 3"],
-        metadata={"constraints": constraints}
+        metadata={
+            "constraints": constraints,
+            "cache": MenuPlanCache.provenance(*cached) if cached else {"hit": False},
+        }
     )
 
+    if cached:
+        entry, _ = cached
+        return {"status": "success", "menu": entry["menu"]}
+
     try:
-        plan = _plan_steps(constraints)
+        plan = _memo(store, "planner", [constraints, seasonal], lambda: _plan_steps(constraints, seasonal))
         
         execution_results = []
-        for i, step in enumerate(plan["steps"]):
-            result = _execute_step(step, i, previous_results=execution_results)
+        for i, step in enumerate(skip_seasonal_steps(plan["steps"])):
+            result = _memo(
+                store, "executor", [step, i, execution_results, seasonal],
+                lambda: _execute_step(step, i, previous_results=execution_results, seasonal=seasonal)
+            )
             execution_results.append(result)
             
-        final_menu = _synthesize_menu(constraints, execution_results)
+        final_menu = _memo(
+            store, "synthesizer", [constraints, execution_results, seasonal],
+            lambda: _synthesize_menu(constraints, execution_results, seasonal)
+        )
+        if store is None:
+            menu_cache.store(constraints, final_menu, scope=seasonal)
         
         return {"status": "success", "menu": final_menu}
 
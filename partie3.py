@@ -2,15 +2,23 @@ import os
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from groq import Groq
+from llm_gateway import gateway
 from langfuse import observe, get_client, Evaluation
-from partie2 import plan_weekly_menu 
+from partie2 import plan_weekly_menu, pipeline_fingerprint
+from result_store import ResultStore, make_key, code_version
+from seasonal_produce import resolve_seasonal, format_seasonal
 
 load_dotenv()
 
-groq_client = Groq()
+groq_client = gateway.groq_client()
 langfuse = get_client()
 
+# Résultats d'expérience sur disque : un re-run ne recalcule que ce qui a changé
+# (entrée de l'item, prompts/modèles des étapes, logique du code), et un run
+# interrompu reprend là où il s'était arrêté.
+EXPERIMENT_VERSION = code_version(__file__, "JUDGE_PROMPT", "JUDGE_MODEL")
+experiment_store = ResultStore(os.getenv("CHEFBOT_EXPERIMENT_STORE", ".chefbot_cache/experiments"))
+
 # 3.1 - CRÉATION DU DATASET
 
 def create_chefbot_dataset():
@@ -94,13 +102,19 @@ Réponds UNIQUEMENT en JSON :
     "explanation": "justification courte"
 }"""
 
+JUDGE_MODEL = "llama-3.3-70b-versatile"
+
+
+def judge_fingerprint() -> str:
+    return make_key(EXPERIMENT_VERSION, JUDGE_MODEL, JUDGE_PROMPT)[:16]
+
 @observe(name="llm-judge", as_type="generation")
 def llm_judge(question: str, output: str, expected: dict) -> dict:
     """Utilisation d'un LLM pour évaluer la qualité sémantique."""
     user_content = f"Contraintes: {question}\n\nMenu généré: {output}"
     
     response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+        model=JUDGE_MODEL,
         messages=[
             {"role": "system", "content": JUDGE_PROMPT},
             {"role": "user", "content": user_content}
@@ -116,19 +130,37 @@ def llm_judge(question: str, output: str, expected: dict) -> dict:
 def run_chefbot_experiment():
     dataset = langfuse.get_dataset("chefbot-menu-eval-baptiste-clement")
 
+    generation_fp = pipeline_fingerprint()
+
     def task(item):
         constraints = item.input["constraints"]
-        result = plan_weekly_menu(constraints)
-        return result.get("menu", "")
+        # Sans mois explicite, les produits dépendent du mois courant
+        seasonal = format_seasonal(resolve_seasonal(constraints))
+        key = make_key("generation", item.input, seasonal, generation_fp)
+        cached = experiment_store.get(key)
+        if cached is not None:
+            return cached["menu"]
+
+        # Les étapes inchangées (plan, exécution) sont relues depuis le store
+        result = plan_weekly_menu(constraints, store=experiment_store)
+        menu = result.get("menu", "")
+        if result["status"] == "success":
+            experiment_store.put(key, {"menu": menu})
+        return menu
 
     def evaluator(**kwargs):
         output = kwargs.get("output")
         expected = kwargs.get("expected_output")
         input_data = kwargs.get("input")
 
-        prog_scores = rule_evaluator(output, expected)
-        
-        llm_scores = llm_judge(input_data["constraints"], output, expected)
+        key = make_key("evaluation", input_data, expected, output, judge_fingerprint())
+        cached = experiment_store.get(key)
+        if cached is not None:
+            prog_scores, llm_scores = cached["rules"], cached["llm"]
+        else:
+            prog_scores = rule_evaluator(output, expected)
+            llm_scores = llm_judge(input_data["constraints"], output, expected)
+            experiment_store.put(key, {"rules": prog_scores, "llm": llm_scores})
 
         return [
             Evaluation(name="safety_rule", value=prog_scores["safety_score"]),
@@ -145,9 +177,12 @@ def run_chefbot_experiment():
         evaluators=[evaluator],
         metadata={
             "model": "llama-3.1-8b-instant",
-            "partie": "3"
+            "partie": "3",
+            "generation_fingerprint": generation_fp,
+            "judge_fingerprint": judge_fingerprint(),
         }
     )
+    print(f"Store d'expérience : {experiment_store.hits} résultats réutilisés, {experiment_store.misses} calculés.")
 
 if __name__ == "__main__":
     create_chefbot_dataset()
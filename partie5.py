@@ -7,48 +7,65 @@
 import os
 import litellm
 from dotenv import load_dotenv
-from smolagents import CodeAgent, LiteLLMModel, tool, Tool
+from smolagents import tool, Tool
 from langfuse import get_client, observe
+from llm_gateway import gateway
+from code_format import CodeFormatNormalizer
+from agent_budget import RunBudget
+from table_sessions import OrderTool, TableSessionStore
+from agent_pool import AgentPool
+from sandbox_pool import SandboxedCodeAgent, get_sandbox_pool
+from tool_output import MAX_OUTPUT_CHARS, paginate, format_table, fit_page
 
 load_dotenv()
 
 litellm.callbacks = ["langfuse_otel"]
 
-model = LiteLLMModel(model_id="groq/meta-llama/llama-4-scout-17b-16e-instruct")
+# Les réponses en ```python (cf. step 1 du run) sont corrigées localement au lieu de coûter un tour
+model = CodeFormatNormalizer(gateway.litellm_model(model_id="groq/meta-llama/llama-4-scout-17b-16e-instruct"))
 
 # 5.1 - OUTIL DE BASE DE DONNÉES 
 
+MENU = [
+    {"nom": "Salade César", "prix": 12, "cat": "entrée", "vege": False, "allergenes": ["gluten"]},
+    {"nom": "Velouté de Potiron", "prix": 9, "cat": "entrée", "vege": True, "allergenes": []},
+    {"nom": "Risotto aux Cèpes", "prix": 18, "cat": "plat", "vege": True, "allergenes": []},
+    {"nom": "Burger Sans Gluten", "prix": 20, "cat": "plat", "vege": False, "allergenes": []},
+    {"nom": "Ratatouille", "prix": 16, "cat": "plat", "vege": True, "allergenes": []},
+    {"nom": "Steak Frites", "prix": 22, "cat": "plat", "vege": False, "allergenes": []},
+    {"nom": "Pâtes au Pesto", "prix": 15, "cat": "plat", "vege": True, "allergenes": ["gluten"]},
+    {"nom": "Mousse Chocolat", "prix": 8, "cat": "dessert", "vege": True, "allergenes": []},
+    {"nom": "Salade de Fruits", "prix": 7, "cat": "dessert", "vege": True, "allergenes": []},
+    {"nom": "Tarte Tatin", "prix": 9, "cat": "dessert", "vege": True, "allergenes": ["gluten"]}
+]
+
 class MenuDatabaseTool(Tool):
     """
     Outil de recherche dans la base de données du restaurant.
     Hérite de la classe Tool pour un contrôle précis des entrées.
     """
     name = "menu_search"
-    description = "Recherche des plats selon la catégorie, le prix max et les allergènes."
+    description = (
+        "Recherche des plats selon la catégorie, le prix max et les allergènes. "
+        "Renvoie un tableau compact (nom|prix|cat|vege|allergenes), paginé avec limit/offset."
+    )
     inputs = {
         "prix_max": {"type": "number", "description": "Budget maximum par plat.", "nullable": True},
         "categorie": {"type": "string", "description": "entrée, plat ou dessert.", "nullable": True},
         "allergene_absent": {"type": "string", "description": "Allergène à exclure (ex: 'gluten').", "nullable": True},
-        "vegetarien": {"type": "boolean", "description": "Filtrer les plats végétariens.", "nullable": True}
+        "vegetarien": {"type": "boolean", "description": "Filtrer les plats végétariens.", "nullable": True},
+        "tri": {"type": "string", "description": "'prix' (moins cher d'abord) ou 'pertinence' (plats convenant au plus de convives d'abord : le moins d'allergènes, végétariens, puis le moins cher).", "nullable": True},
+        "limit": {"type": "integer", "description": "Nombre maximum de plats renvoyés (défaut : 10).", "nullable": True},
+        "offset": {"type": "integer", "description": "Position du premier plat renvoyé, pour la page suivante.", "nullable": True}
     }
     output_type = "string"
 
     def __init__(self):
         super().__init__()
-        self.menu = [
-            {"nom": "Salade César", "prix": 12, "cat": "entrée", "vege": False, "allergenes": ["gluten"]},
-            {"nom": "Velouté de Potiron", "prix": 9, "cat": "entrée", "vege": True, "allergenes": []},
-            {"nom": "Risotto aux Cèpes", "prix": 18, "cat": "plat", "vege": True, "allergenes": []},
-            {"nom": "Burger Sans Gluten", "prix": 20, "cat": "plat", "vege": False, "allergenes": []},
-            {"nom": "Ratatouille", "prix": 16, "cat": "plat", "vege": True, "allergenes": []},
-            {"nom": "Steak Frites", "prix": 22, "cat": "plat", "vege": False, "allergenes": []},
-            {"nom": "Pâtes au Pesto", "prix": 15, "cat": "plat", "vege": True, "allergenes": ["gluten"]},
-            {"nom": "Mousse Chocolat", "prix": 8, "cat": "dessert", "vege": True, "allergenes": []},
-            {"nom": "Salade de Fruits", "prix": 7, "cat": "dessert", "vege": True, "allergenes": []},
-            {"nom": "Tarte Tatin", "prix": 9, "cat": "dessert", "vege": True, "allergenes": ["gluten"]}
-        ]
-
-    def forward(self, prix_max: float = None, categorie: str = None, allergene_absent: str = None, vegetarien: bool = False) -> str:
+        self.menu = MENU
+
+    def forward(self, prix_max: float = None, categorie: str = None, allergene_absent: str = None, vegetarien: bool = False,
+                tri: str = None, limit: int = None, offset: int = None) -> str:
         results = self.menu
         if prix_max:
             results = [p for p in results if p["prix"] <= prix_max]
@@ -61,7 +78,15 @@ class MenuDatabaseTool(Tool):
         
         if not results:
             return "Aucun plat ne correspond à vos critères."
-        return "\n".join([f"- {p['nom']} ({p['prix']}€)" for p in results])
+
+        if tri == "prix":
+            results = sorted(results, key=lambda p: p["prix"])
+        elif tri == "pertinence":
+            # Le moins d'allergènes, végétarien (convient aussi aux autres convives), puis le moins cher
+            results = sorted(results, key=lambda p: (len(p["allergenes"]), not p["vege"], p["prix"]))
+
+        page, total = paginate(results, limit, offset)
+        return fit_page(page, total, offset, lambda rows: format_table(rows, ["nom", "prix", "cat", "vege", "allergenes"]))
 
 @tool
 def calculate(expression: str) -> str:
@@ -89,36 +114,62 @@ instructions = (
     "3. Ton code doit être valide et utiliser les outils mis à ta disposition.\n"
     "\n"
     "DÉMARCHE :\n"
-    "- Cherche les plats via 'menu_search'.\n"
-    "- Calcule le total avec 'calculate'.\n"
+    "- Cherche les plats via 'menu_search' (tri='pertinence' ou 'prix', limit court ; offset pour la suite).\n"
+    "- Enregistre les plats choisis avec 'commande' (action='ajouter') : c'est elle qui fait foi pour l'addition.\n"
+    "- Calcule le total avec 'calculate' ou 'commande' (action='voir').\n"
     "- Respecte les contraintes (Végétarien, Sans Gluten, Budget 60€).\n"
     "- Utilise 'final_answer' pour conclure avec le menu complet."
 )
 
-agent = CodeAgent(
-    tools=[MenuDatabaseTool(), calculate],
-    model=model,
-    planning_interval=2,
-    max_steps=8, 
-    instructions=instructions
+def build_restaurant_agent():
+    # Code généré exécuté dans le pool de workers : les tables ne se bloquent pas entre elles
+    return SandboxedCodeAgent(
+        tools=[MenuDatabaseTool(), calculate, OrderTool(MENU)],
+        model=model,
+        planning_interval=2,
+        max_steps=8, 
+        max_print_outputs_length=MAX_OUTPUT_CHARS,
+        instructions=instructions
+    )
+
+# Agents construits une fois puis prêtés à chaque tour (pas de setup par requête)
+agent_pool = AgentPool(build_restaurant_agent, size=int(os.getenv("CHEFBOT_AGENT_POOL_SIZE", "4")))
+
+# 5.3 - SESSIONS DE TABLE : état compact sur disque, plusieurs tables par process
+sessions = TableSessionStore(
+    os.getenv("CHEFBOT_TABLES_DIR", ".chefbot_cache/tables"),
+    agent_pool,
 )
 
 @observe(name="restaurant-demo")
 def run_restaurant():
     print("--- 5.2 : Test Agent Planificateur ---")
+    # Un seul budget pour tout le dialogue : latence max prévisible même en cas de rate limit
+    budget = RunBudget(deadline_s=180, max_tokens=80000)
+
+    table = "table-3"
+
     query = "On est 3. Un végétarien, un sans gluten, et moi je mange de tout. Budget max 60€ au total. Proposez-nous un menu."
-    print(agent.run(query))
+    print(sessions.ask(table, query, budget))
 
+    # Chaque tour recharge l'état compact de la table : le dialogue survit à un redémarrage
     print("\n--- 5.3 : Dialogue Multi-tours ---")
     
     print("User: Finalement, un autre dessert (sans gluten) pour tout le groupe.")
-    res2 = agent.run("Propose un autre dessert sans gluten à la place. Recalcule le total.", reset=False)
+    res2 = sessions.ask(table, "Propose un autre dessert sans gluten à la place. Recalcule le total.", budget)
     print(f"Agent: {res2}")
 
     print("\nUser: C'est parfait, l'addition s'il vous plaît.")
-    res3 = agent.run("Donne-nous l'addition finale détaillée.", reset=False)
+    res3 = sessions.ask(table, "Donne-nous l'addition finale détaillée.", budget)
     print(f"Agent: {res3}")
 
+    if budget.stop_reason:
+        print(f"\nArrêt anticipé : {budget.stop_reason}")
+    print(f"\nFormat de code corrigé localement (tokens de relance évités, estimés) : {model.stats}")
+    print(f"Pool d'agents : {agent_pool.stats()}")
+    if get_sandbox_pool():
+        print(f"Workers d'exécution : {get_sandbox_pool().stats()}")
+
 if __name__ == "__main__":
     run_restaurant()
     get_client().flush()
\ No newline at end of file
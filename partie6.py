@@ -1,16 +1,23 @@
+import os
 from dotenv import load_dotenv
-from smolagents import CodeAgent, LiteLLMModel, tool, WebSearchTool, VisitWebpageTool
+from smolagents import tool, WebSearchTool, VisitWebpageTool
 from langfuse import observe, get_client
+from llm_gateway import gateway
+from code_format import CodeFormatNormalizer
+from agent_budget import RunBudget, run_with_budget
+from agent_pool import AgentPool
+from sandbox_pool import SandboxedCodeAgent, get_sandbox_pool
+from tool_output import MAX_OUTPUT_CHARS, paginate, format_table, fit_page, bound_output
 import litellm
 
 load_dotenv()
 
-model = LiteLLMModel(model_id="groq/meta-llama/llama-4-scout-17b-16e-instruct")
+model = CodeFormatNormalizer(gateway.litellm_model(model_id="groq/meta-llama/llama-4-scout-17b-16e-instruct"))
 
 
 def build_multi_agent_system():
 
-    nutritionist_agent = CodeAgent(
+    nutritionist_agent = SandboxedCodeAgent(
         tools=[check_dietary_info],
         model=model,
         name="nutritionist_agent",
@@ -19,9 +26,10 @@ def build_multi_agent_system():
             "Give it a question about nutrition or meal planning and it will provide informed guidance."
         ),
         max_steps=5,
+        max_print_outputs_length=MAX_OUTPUT_CHARS,
     )
 
-    chef_agent = CodeAgent(
+    chef_agent = SandboxedCodeAgent(
         tools=[check_fridge, get_recipe],
         model=model,
         name="chef_agent",
@@ -30,9 +38,10 @@ def build_multi_agent_system():
             "Give it a question about cooking or meal preparation and it will offer practical advice."
         ),
         max_steps=5,
+        max_print_outputs_length=MAX_OUTPUT_CHARS,
     )
 
-    budget_agent = CodeAgent(
+    budget_agent = SandboxedCodeAgent(
         tools=[],
         model=model,
         name="budget_agent",
@@ -41,9 +50,10 @@ def build_multi_agent_system():
             "Give it a question about budgeting for meals and it will provide cost-effective suggestions."
         ),
         max_steps=5,
+        max_print_outputs_length=MAX_OUTPUT_CHARS,
     )
 
-    manager = CodeAgent(
+    manager = SandboxedCodeAgent(
         tools=[],
         model=model,
         managed_agents=[nutritionist_agent, chef_agent, budget_agent],
@@ -53,6 +63,7 @@ def build_multi_agent_system():
             "It takes dietary constraints as input and delegates tasks to the sub-agents to generate a comprehensive meal plan."
         ),
         max_steps=8,
+        max_print_outputs_length=MAX_OUTPUT_CHARS,
     )
     return manager
 
@@ -72,11 +83,15 @@ DIETARY_INFO = {
 # Outils
 
 @tool
-def check_fridge():
+def check_fridge(limit: int = None, offset: int = 0) -> str:
     """
-    Retourne une liste d'ingrédients disponibles dans le frigo.
+    Retourne une liste d'ingrédients disponibles dans le frigo (paginée).
+    Args:
+        limit: Nombre maximum d'ingrédients renvoyés (défaut : 10).
+        offset: Position du premier ingrédient renvoyé, pour la page suivante.
     """
-    return ", ".join(FRIDGE_CONTENT)
+    page, total = paginate(FRIDGE_CONTENT, limit, offset)
+    return fit_page(page, total, offset, ", ".join, sep=" ")
 
 @tool
 def get_recipe(dish_name: str) -> str:
@@ -100,20 +115,25 @@ def check_dietary_info(ingredient: str) -> str:
     """
     info = DIETARY_INFO.get(ingredient.lower())
     if info:
-        return f"Infos pour {ingredient}: {info}"
+        return bound_output(format_table([{"ingredient": ingredient, **info}], ["ingredient", "calories", "allergenes"]))
     return f"Pas d'infos pour {ingredient}"
 
 
-# Create the system
-manager_agent = build_multi_agent_system()
+# Create the system : managers (avec leurs agents gérés) préconstruits et réutilisés entre requêtes
+manager_pool = AgentPool(build_multi_agent_system, size=int(os.getenv("CHEFBOT_AGENT_POOL_SIZE", "2")))
 
-# Execute a query
-query = query = """
+if __name__ == "__main__":
+    # Execute a query
+    query = query = """
 Prépare un menu de 4 services pour 8 personnes (2 végé, 1 sans gluten, 1 sans arachides). 
 Budget max: 120€. 
 REMPLI : Demande au Chef les noms des plats et au Budget Agent le calcul final. 
 Sois bref.
 """
-response = manager_agent.run(query)
+    with manager_pool.checkout() as manager_agent:
+        response = run_with_budget(manager_agent, query, RunBudget(deadline_s=240, max_tokens=100000))
 
-print(response)
\ No newline at end of file
+    print(response)
+    print(f"Pool d'agents : {manager_pool.stats()}")
+    if get_sandbox_pool():
+        print(f"Workers d'exécution : {get_sandbox_pool().stats()}")
\ No newline at end of file
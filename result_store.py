@@ -0,0 +1,76 @@
+import os
+import ast
+import json
+import hashlib
+import tempfile
+import threading
+
+# STOCKAGE DE RÉSULTATS SUR DISQUE
+#
+# Un fichier JSON par clé, écrit de façon atomique : un run interrompu garde
+# tout ce qui a déjà été calculé, et la reprise relit simplement les fichiers.
+
+
+def make_key(*parts) -> str:
+    """Clé stable (sha256) à partir de n'importe quelles valeurs sérialisables en JSON."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def code_version(path: str, *excluded: str) -> str:
+    """
+    Version de la logique d'un module : empreinte de son AST (commentaires et mise
+    en forme ignorés), sans les affectations de premier niveau nommées dans `excluded`
+    (prompts, modèles...), qui ont leur propre empreinte par étape.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    tree.body = [
+        node for node in tree.body
+        if not (isinstance(node, (ast.Assign, ast.AnnAssign))
+                and all(isinstance(t, ast.Name) and t.id in excluded
+                        for t in (node.targets if isinstance(node, ast.Assign) else [node.target])))
+    ]
+    return hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()[:16]
+
+
+class ResultStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: str, value) -> None:
+        # Fichier temporaire unique : deux écritures concurrentes de la même clé ne se marchent pas dessus
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get_or_compute(self, key: str, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
@@ -0,0 +1,512 @@
+import os
+import sys
+import time
+import uuid
+import atexit
+import pickle
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener
+from smolagents import CodeAgent
+from smolagents.local_python_executor import (
+    BASE_BUILTIN_MODULES,
+    BASE_PYTHON_TOOLS,
+    DEFAULT_MAX_LEN_OUTPUT,
+    CodeOutput,
+    InterpreterError,
+    PythonExecutor,
+    evaluate_python_code,
+)
+from smolagents.utils import truncate_content
+
+try:
+    import resource
+except ImportError:  # Windows : pas de limites CPU/mémoire par snippet
+    resource = None
+
+# POOL DE WORKERS POUR LE CODE DES AGENTS
+#
+# Le code Python écrit par le modèle tournait dans le process (et le thread)
+# de l'orchestration : un snippet lent bloquait tout, et plusieurs sessions
+# d'agents se partageaient le même cœur. Ici, des process workers sont forkés
+# à l'avance (interpréteur smolagents déjà chargé et préchauffé) et chaque
+# snippet s'exécute dans l'un d'eux, avec une limite CPU et mémoire. Plusieurs
+# agents exécutent donc leur code en parallèle, sur plusieurs cœurs.
+#
+# Les workers ne sont jamais forkés depuis le process principal (threads
+# Langfuse/OTel, httpx... : un fork peut hériter d'un verrou pris). Un process
+# "forker" dédié, lancé à neuf et sans threads, préchauffe l'interpréteur puis
+# forke chaque worker à la demande ; le worker se connecte au pool par socket.
+#
+# Les outils (commande de la table, agents gérés, pool HTTP...) gardent leur
+# état côté parent : dans le worker, chaque outil est un proxy qui renvoie
+# l'appel au parent par le pipe et attend le résultat.
+#
+# Une session (un exécuteur d'agent) est épinglée à un worker : ses variables,
+# modules importés, classes et fonctions définies par le modèle y restent d'une
+# étape à l'autre, sans passer par pickle. Si ce worker est occupé, la session
+# l'attend ; s'il a été tué, la session repart sur un autre et le signale.
+# Un agent géré (appelé depuis le snippet de son manager, qui tient déjà un
+# worker) n'attend son worker qu'un temps borné, sinon deux managers croisés
+# s'interbloqueraient : il repart alors sur un worker libre, ou le pool grandit.
+
+# Garde-fou mémoire : au-delà, les sessions les plus anciennes d'un worker sont oubliées
+MAX_SESSIONS_PER_WORKER = 256
+
+
+class SnippetLimitExceeded(BaseException):
+    """Levée dans le worker quand un snippet dépasse sa limite CPU (hors `except Exception`)."""
+
+
+def _picklable(variables: dict):
+    """Sépare les variables transférables entre process de celles qui ne le sont pas."""
+    kept, dropped = {}, []
+    for key, value in variables.items():
+        try:
+            pickle.dumps(value)
+            kept[key] = value
+        except Exception:
+            dropped.append(key)
+    return kept, dropped
+
+
+def _on_sigxcpu(signum, frame):
+    raise SnippetLimitExceeded("limite de temps CPU du snippet dépassée")
+
+
+def _set_limits(cpu_s: float, mem_mb: int) -> None:
+    if resource is None:
+        return
+    if cpu_s:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(used.ru_utime + used.ru_stime + cpu_s) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+    if mem_mb:
+        # Limite relative à l'empreinte actuelle du worker (hérité du parent par fork)
+        try:
+            with open("/proc/self/statm") as f:
+                current = int(f.read().split()[0]) * resource.getpagesize()
+        except OSError:  # pas de /proc (macOS) : pas de limite mémoire
+            return
+        resource.setrlimit(resource.RLIMIT_AS, (current + mem_mb * 1024 * 1024, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+
+def _clear_limits() -> None:
+    if resource is None:
+        return
+    for limit in (resource.RLIMIT_CPU, resource.RLIMIT_AS):
+        resource.setrlimit(limit, (resource.getrlimit(limit)[1], resource.getrlimit(limit)[1]))
+
+
+def _worker_main(conn) -> None:
+    """Boucle d'un worker : exécute les snippets reçus, relaie les appels d'outils au parent."""
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    # session -> état de l'interpréteur (variables, modules) et fonctions définies par le modèle
+    sessions = OrderedDict()
+
+    def make_proxy(tool_name):
+        def proxy(*args, **kwargs):
+            conn.send(("tool", tool_name, args, kwargs))
+            ok, value = conn.recv()
+            if not ok:
+                raise InterpreterError(value)
+            return value
+        return proxy
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        _, session, resume, forget, variables, code, tool_names, authorized_imports, max_print, cpu_s, mem_mb = message
+
+        for old in forget:
+            sessions.pop(old, None)
+        context = sessions.pop(session, None)
+        # Session censée exister ici mais absente (oubliée) : l'agent doit le savoir
+        lost = resume and context is None
+        if context is None:
+            context = {"state": {"__name__": "__main__"}, "custom_tools": {}}
+        sessions[session] = context
+        while len(sessions) > MAX_SESSIONS_PER_WORKER:
+            sessions.popitem(last=False)
+        state, custom_tools = context["state"], context["custom_tools"]
+        state.update(variables)
+
+        static_tools = {**{name: make_proxy(name) for name in tool_names}, **BASE_PYTHON_TOOLS}
+        try:
+            _set_limits(cpu_s, mem_mb)
+            try:
+                output, is_final_answer = evaluate_python_code(
+                    code,
+                    static_tools=static_tools,
+                    custom_tools=custom_tools,
+                    state=state,
+                    authorized_imports=authorized_imports,
+                    max_print_outputs_length=max_print,
+                    timeout_seconds=None,
+                )
+            finally:
+                _clear_limits()
+            error = None
+        except (Exception, SnippetLimitExceeded) as e:
+            output, is_final_answer = None, False
+            error = str(e) if not isinstance(e, MemoryError) else "limite mémoire du snippet dépassée"
+
+        logs = truncate_content(str(state.get("_print_outputs", "")), max_length=max_print)
+        try:
+            pickle.dumps(output)
+        except Exception:
+            output = repr(output)
+        conn.send(("done", output, is_final_answer, logs, error, lost))
+
+
+def _forker_main(address: str) -> None:
+    """Process forker (mono-thread) : forke un worker par ligne reçue sur stdin, jusqu'à EOF."""
+    authkey = bytes.fromhex(os.environ.pop("CHEFBOT_SANDBOX_AUTHKEY"))
+    # Les workers terminés sont récoltés automatiquement
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # Préchauffage : premier passage dans l'interpréteur, hérité par chaque worker
+    evaluate_python_code("x = 1", static_tools=dict(BASE_PYTHON_TOOLS), timeout_seconds=None)
+
+    for _ in sys.stdin.buffer:
+        if os.fork() == 0:
+            code = 1
+            try:
+                sys.stdin.close()
+                conn = Client(address, family="AF_UNIX", authkey=authkey)
+                conn.send(os.getpid())
+                _worker_main(conn)
+                code = 0
+            finally:
+                os._exit(code)
+
+
+class _Worker:
+    def __init__(self, conn, pid: int):
+        self.conn = conn
+        self.id = pid
+
+    def kill(self) -> None:
+        try:
+            os.kill(self.id, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Workers préforkés partagés par tous les agents du process. Limites par snippet :
+    `cpu_s` secondes CPU, `mem_mb` Mo de mémoire en plus de l'empreinte du worker,
+    `wall_s` secondes d'exécution (hors temps passé dans les outils) avant que le
+    worker soit tué et remplacé. Un agent géré dont le worker épinglé reste occupé
+    plus de `pin_wait_s` secondes repart sur un autre worker (état perdu, signalé).
+    """
+
+    def __init__(self, size: int = 4, cpu_s: float = 10, mem_mb: int = 512, wall_s: float = 30,
+                 pin_wait_s: float = 2):
+        self.size = size
+        self.cpu_s = cpu_s
+        self.mem_mb = mem_mb
+        self.wall_s = wall_s
+        self.pin_wait_s = pin_wait_s
+        self._workers = {}
+        self._busy = set()
+        # Sessions épinglées par worker (répartition) et sessions à oublier au prochain snippet
+        self._pins = {}
+        self._forget = {}
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats = {"snippets": 0, "wait_s": 0.0, "exec_s": 0.0, "killed": 0, "grown": 0, "lost_sessions": 0}
+
+        start = time.perf_counter()
+        self._dir = tempfile.mkdtemp(prefix="chefbot-sandbox-")
+        self._address = os.path.join(self._dir, "pool.sock")
+        authkey = os.urandom(16)
+        self._listener = Listener(self._address, family="AF_UNIX", authkey=authkey)
+        self._forker = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self._address],
+            stdin=subprocess.PIPE,
+            env={**os.environ, "CHEFBOT_SANDBOX_AUTHKEY": authkey.hex()},
+        )
+        self._spawn_lock = threading.Lock()
+        atexit.register(self.close)
+        for _ in range(size):
+            self._add(self._spawn())
+        self.start_s = time.perf_counter() - start
+
+    @classmethod
+    def from_env(cls) -> "SandboxPool":
+        return cls(
+            size=int(os.getenv("CHEFBOT_SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            cpu_s=float(os.getenv("CHEFBOT_SANDBOX_CPU_S", "10")),
+            mem_mb=int(os.getenv("CHEFBOT_SANDBOX_MEM_MB", "512")),
+            wall_s=float(os.getenv("CHEFBOT_SANDBOX_WALL_S", "30")),
+            pin_wait_s=float(os.getenv("CHEFBOT_SANDBOX_PIN_WAIT_S", "2")),
+        )
+
+    def _spawn(self) -> _Worker:
+        """Demande un worker au forker. Jamais appelé avec `_cond` tenu."""
+        with self._spawn_lock:
+            if self._forker.poll() is not None:
+                raise InterpreterError("Le process forker du pool d'exécution s'est arrêté.")
+            self._forker.stdin.write(b"fork\n")
+            self._forker.stdin.flush()
+            conn = self._listener.accept()
+            return _Worker(conn, conn.recv())
+
+    def _add(self, worker: _Worker, busy: bool = False) -> None:
+        with self._cond:
+            self._workers[worker.id] = worker
+            self._pins[worker.id] = 0
+            self._forget[worker.id] = []
+            if busy:
+                self._busy.add(worker.id)
+            self._cond.notify_all()
+
+    def _remove(self, worker: _Worker) -> None:
+        with self._cond:
+            self._workers.pop(worker.id, None)
+            self._busy.discard(worker.id)
+            self._pins.pop(worker.id, None)
+            self._forget.pop(worker.id, None)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """Arrête le forker et les workers (appelé à la sortie du process)."""
+        with self._cond:
+            workers, self._workers = list(self._workers.values()), {}
+        for worker in workers:
+            worker.kill()
+        if self._forker.poll() is None:
+            self._forker.stdin.close()
+            self._forker.wait(timeout=5)
+        self._listener.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def forget(self, worker_id: int, session: str) -> None:
+        """La session est terminée : son état sera libéré au prochain snippet du worker."""
+        with self._cond:
+            if worker_id in self._workers:
+                self._pins[worker_id] -= 1
+                self._forget[worker_id].append(session)
+
+    def _acquire(self, session: str, pinned):
+        """
+        Retourne (worker, épinglé à nouveau ?, attente). Attend le worker épinglé s'il est
+        occupé ; depuis un snippet (worker déjà tenu), au plus `pin_wait_s` secondes.
+        """
+        start = time.perf_counter()
+        held = self._local.__dict__.setdefault("held", set())
+        with self._cond:
+            if pinned in self._workers and pinned not in held:
+                # Un thread qui tient déjà un worker (agent géré appelé depuis un snippet) n'attend
+                # pas indéfiniment : deux managers qui appellent chacun un agent épinglé sur le
+                # worker de l'autre s'attendraient mutuellement.
+                deadline = start + self.pin_wait_s if held else None
+                while pinned in self._busy:
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if pinned in self._workers and pinned not in self._busy:
+                    self._busy.add(pinned)
+                    return self._workers[pinned], False, time.perf_counter() - start
+            if pinned in self._workers:
+                # Worker épinglé tenu par ce thread, ou trop longtemps occupé : la session repart ailleurs
+                self._pins[pinned] -= 1
+                self._forget[pinned].append(session)
+
+            # Nouvelle session (ou worker perdu) : le worker libre qui porte le moins de sessions
+            while True:
+                free = [w for w in self._workers if w not in self._busy]
+                if free:
+                    worker_id = min(free, key=self._pins.get)
+                    self._busy.add(worker_id)
+                    self._pins[worker_id] += 1
+                    return self._workers[worker_id], True, time.perf_counter() - start
+                if held:
+                    # Agent géré appelé depuis un snippet alors que tout est occupé : on agrandit le pool
+                    self._stats["grown"] += 1
+                    break
+                self._cond.wait()
+
+        worker = self._spawn()
+        self._add(worker, busy=True)
+        with self._cond:
+            self.size += 1
+            self._pins[worker.id] += 1
+        return worker, True, time.perf_counter() - start
+
+    def _release(self, worker: _Worker) -> None:
+        with self._cond:
+            self._busy.discard(worker.id)
+            self._cond.notify_all()
+
+    def run(self, session: str, started: bool, pinned, variables: dict, updates: dict, code: str,
+            tools: dict, authorized_imports: list, max_print_outputs_length: int):
+        """
+        Exécute un snippet de `session` ; retourne (id du worker, sortie, réponse finale ?, logs,
+        erreur, session perdue ?). `variables` (toutes) est envoyé quand la session change de
+        worker, sinon seulement `updates`.
+        """
+        worker, repinned, wait = self._acquire(session, pinned)
+        self._local.held.add(worker.id)
+        exec_s = 0.0
+        try:
+            with self._cond:
+                forget, self._forget[worker.id] = self._forget[worker.id], []
+            resume = started and not repinned
+            worker.conn.send(("run", session, resume, forget, updates if resume else variables, code, list(tools),
+                              authorized_imports, max_print_outputs_length, self.cpu_s, self.mem_mb))
+            while True:
+                start = time.perf_counter()
+                if not worker.conn.poll(max(0.0, self.wall_s - exec_s)):
+                    raise TimeoutError
+                message = worker.conn.recv()
+                exec_s += time.perf_counter() - start
+                if message[0] == "done":
+                    _, output, is_final_answer, logs, error, lost = message
+                    # Changement de worker en cours de session = état des étapes précédentes perdu
+                    lost = lost or (started and repinned)
+                    if lost:
+                        with self._cond:
+                            self._stats["lost_sessions"] += 1
+                    return worker.id, output, is_final_answer, logs, error, lost
+                # Appel d'outil relayé : exécuté ici, avec l'état réel de l'outil
+                _, name, args, kwargs = message
+                try:
+                    reply = (True, tools[name](*args, **kwargs))
+                    worker.conn.send(reply)
+                except Exception as e:
+                    worker.conn.send((False, f"{type(e).__name__}: {e}"))
+        except (TimeoutError, EOFError, OSError) as e:
+            if isinstance(e, TimeoutError):
+                exec_s = self.wall_s
+            worker.kill()
+            self._remove(worker)
+            with self._cond:
+                self._stats["killed"] += 1
+            # Le worker tué est remplacé pour garder la taille du pool ; ses sessions sont perdues
+            self._add(self._spawn())
+            reason = f"exécution interrompue après {self.wall_s}s" if isinstance(e, TimeoutError) else "le worker s'est arrêté"
+            raise InterpreterError(
+                f"Snippet abandonné : {reason}. Les variables et fonctions des étapes précédentes sont perdues."
+            ) from None
+        finally:
+            self._local.held.discard(worker.id)
+            self._release(worker)
+            with self._cond:
+                self._stats["snippets"] += 1
+                self._stats["wait_s"] += wait
+                self._stats["exec_s"] += exec_s
+
+    def stats(self) -> dict:
+        with self._cond:
+            n = self._stats["snippets"]
+            return {
+                "workers": len(self._workers),
+                "idle": len(self._workers) - len(self._busy),
+                "sessions": sum(self._pins.values()),
+                "start_ms": round(1000 * self.start_s, 2),
+                "snippets": n,
+                "avg_wait_ms": round(1000 * self._stats["wait_s"] / n, 2) if n else 0.0,
+                "avg_exec_ms": round(1000 * self._stats["exec_s"] / n, 2) if n else 0.0,
+                "killed": self._stats["killed"],
+                "grown": self._stats["grown"],
+                "lost_sessions": self._stats["lost_sessions"],
+            }
+
+
+class PooledPythonExecutor(PythonExecutor):
+    """
+    Exécuteur smolagents adossé au SandboxPool. L'état de l'interpréteur vit dans
+    le worker où la session est épinglée ; côté agent, `state` ne garde que les
+    variables envoyées par l'agent et les logs du dernier snippet.
+    """
+
+    def __init__(self, pool: SandboxPool, additional_authorized_imports: list, max_print_outputs_length: int = None):
+        self.pool = pool
+        self.authorized_imports = list(set(BASE_BUILTIN_MODULES) | set(additional_authorized_imports))
+        self.max_print_outputs_length = max_print_outputs_length or DEFAULT_MAX_LEN_OUTPUT
+        self.state = {"__name__": "__main__"}
+        self.tools = {}
+        self._worker = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Nouvelle session : variables et fonctions définies par le modèle oubliées."""
+        if self._worker is not None:
+            self.pool.forget(self._worker, self.session)
+        self.state.clear()
+        self.state["__name__"] = "__main__"
+        self.session = uuid.uuid4().hex
+        self._worker = None
+        self._started = False
+        self._variables = {}
+        self._updates = {}
+
+    def send_tools(self, tools: dict) -> None:
+        self.tools = dict(tools)
+
+    def send_variables(self, variables: dict) -> None:
+        self.state.update(variables)
+        self._variables.update(variables)
+        self._updates.update(variables)
+
+    def __call__(self, code_action: str) -> CodeOutput:
+        variables, dropped = _picklable(self._variables)
+        updates = {k: v for k, v in variables.items() if k in self._updates}
+        self._worker, output, is_final_answer, logs, error, lost = self.pool.run(
+            self.session, self._started, self._worker, variables, updates, code_action,
+            self.tools, self.authorized_imports, self.max_print_outputs_length,
+        )
+        self._started = True
+        self._updates = {}
+        if lost:
+            logs += "\n[le worker de cette session a été remplacé : variables, imports et fonctions des étapes précédentes sont perdus]"
+        if dropped:
+            logs += f"\n[variables non transmissibles au worker : {', '.join(sorted(dropped))}]"
+        self.state["_print_outputs"] = logs
+        if error is not None:
+            raise InterpreterError(error)
+        return CodeOutput(output=output, logs=logs, is_final_answer=is_final_answer)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool():
+    """Pool partagé du process, créé au premier agent ; None si désactivé (CHEFBOT_SANDBOX=0) ou sans fork."""
+    global _pool
+    if os.getenv("CHEFBOT_SANDBOX", "1") == "0" or not hasattr(os, "fork"):
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool.from_env()
+        return _pool
+
+
+class SandboxedCodeAgent(CodeAgent):
+    """CodeAgent dont le code s'exécute dans le SandboxPool (exécuteur local si indisponible)."""
+
+    def __init__(self, *args, sandbox: SandboxPool = None, **kwargs):
+        self.sandbox = sandbox or get_sandbox_pool()
+        super().__init__(*args, **kwargs)
+
+    def create_python_executor(self) -> PythonExecutor:
+        if self.sandbox is None or self.executor_type != "local":
+            return super().create_python_executor()
+        return PooledPythonExecutor(self.sandbox, self.additional_authorized_imports, self.max_print_outputs_length)
+
+
+if __name__ == "__main__":
+    _forker_main(sys.argv[1])
@@ -0,0 +1,155 @@
+import re
+from datetime import datetime
+from menu_cache import normalize
+from result_store import make_key
+
+# BASE LOCALE DES PRODUITS DE SAISON
+#
+# Les prompts demandaient au modèle de retrouver lui-même les produits du mois
+# ("ingrédients de février uniquement"), à chaque appel et à chaque étape.
+# On résout ici les contraintes (mois/saison, budget, région) avant le prompt :
+# le modèle reçoit une liste courte et précise, et l'étape "identifier les
+# ingrédients de saison" devient inutile.
+
+MONTHS = ["janvier", "fevrier", "mars", "avril", "mai", "juin", "juillet",
+          "aout", "septembre", "octobre", "novembre", "decembre"]
+
+LABELS = {"fevrier": "février", "aout": "août", "decembre": "décembre", "ete": "été"}
+
+SEASON_MONTHS = {
+    "hiver": [12, 1, 2],
+    "printemps": [3, 4, 5],
+    "ete": [6, 7, 8],
+    "automne": [9, 10, 11],
+}
+
+# Régions reconnues dans les contraintes -> étiquette utilisée dans la table
+REGIONS = {
+    "bretagne": "Ouest", "normandie": "Ouest", "ouest": "Ouest",
+    "provence": "Sud", "sud": "Sud", "occitanie": "Sud", "corse": "Sud",
+    "alsace": "Est", "lorraine": "Est", "grand est": "Est",
+    "nord": "Nord", "picardie": "Nord",
+    "loire": "Centre", "centre": "Centre",
+}
+
+# (nom, catégorie, mois, palier de prix 1=€ 2=€€ 3=€€€, régions de production)
+PRODUCE = [
+    ("poireau", "légume", [1, 2, 3, 4, 9, 10, 11, 12], 1, ["Nord", "Ouest", "Centre"]),
+    ("chou vert", "légume", [1, 2, 3, 10, 11, 12], 1, ["Ouest", "Nord", "Est"]),
+    ("chou-fleur", "légume", [1, 2, 3, 4, 10, 11, 12], 1, ["Ouest"]),
+    ("carotte", "légume", [1, 2, 3, 4, 6, 7, 8, 9, 10, 11, 12], 1, ["Ouest", "Nord", "Centre"]),
+    ("pomme de terre", "légume", list(range(1, 13)), 1, ["Nord", "Ouest", "Centre"]),
+    ("navet", "légume", [1, 2, 3, 10, 11, 12], 1, ["Ouest", "Centre"]),
+    ("panais", "légume", [1, 2, 3, 10, 11, 12], 1, ["Ouest", "Centre"]),
+    ("céleri-rave", "légume", [1, 2, 3, 9, 10, 11, 12], 1, ["Nord", "Centre"]),
+    ("betterave", "légume", [1, 2, 3, 7, 8, 9, 10, 11, 12], 1, ["Nord"]),
+    ("endive", "légume", [1, 2, 3, 4, 10, 11, 12], 1, ["Nord"]),
+    ("oignon", "légume", list(range(1, 13)), 1, ["Nord", "Ouest", "Centre"]),
+    ("courge butternut", "légume", [1, 2, 9, 10, 11, 12], 1, ["Centre", "Ouest"]),
+    ("potiron", "légume", [1, 9, 10, 11, 12], 1, ["Centre", "Ouest"]),
+    ("topinambour", "légume", [1, 2, 3, 10, 11, 12], 2, ["Ouest", "Centre"]),
+    ("mâche", "légume", [1, 2, 3, 10, 11, 12], 2, ["Centre", "Ouest"]),
+    ("épinard", "légume", [3, 4, 5, 9, 10, 11], 2, ["Ouest", "Centre"]),
+    ("radis", "légume", [3, 4, 5, 6], 1, ["Ouest", "Centre"]),
+    ("asperge", "légume", [4, 5, 6], 3, ["Centre", "Sud"]),
+    ("petits pois", "légume", [5, 6, 7], 2, ["Nord", "Ouest"]),
+    ("artichaut", "légume", [5, 6, 7, 8, 9], 2, ["Ouest", "Sud"]),
+    ("courgette", "légume", [6, 7, 8, 9], 1, ["Sud", "Centre"]),
+    ("tomate", "légume", [6, 7, 8, 9], 2, ["Sud", "Ouest"]),
+    ("aubergine", "légume", [6, 7, 8, 9], 2, ["Sud"]),
+    ("poivron", "légume", [7, 8, 9], 2, ["Sud"]),
+    ("haricot vert", "légume", [6, 7, 8, 9], 2, ["Ouest", "Centre"]),
+    ("champignon de Paris", "légume", list(range(1, 13)), 2, ["Centre", "Ouest"]),
+    ("cèpe", "légume", [9, 10, 11], 3, ["Sud", "Centre"]),
+    ("pomme", "fruit", [1, 2, 3, 4, 8, 9, 10, 11, 12], 1, ["Centre", "Sud", "Est"]),
+    ("poire", "fruit", [1, 2, 3, 8, 9, 10, 11, 12], 1, ["Centre", "Sud"]),
+    ("kiwi", "fruit", [1, 2, 3, 11, 12], 2, ["Sud"]),
+    ("orange", "fruit", [1, 2, 3, 12], 2, ["Sud"]),
+    ("clémentine", "fruit", [1, 2, 11, 12], 2, ["Sud"]),
+    ("citron", "fruit", [1, 2, 3, 12], 2, ["Sud"]),
+    ("rhubarbe", "fruit", [4, 5, 6], 2, ["Est", "Nord"]),
+    ("fraise", "fruit", [4, 5, 6, 7], 3, ["Sud", "Ouest"]),
+    ("cerise", "fruit", [5, 6, 7], 3, ["Sud", "Est"]),
+    ("abricot", "fruit", [6, 7, 8], 2, ["Sud"]),
+    ("pêche", "fruit", [6, 7, 8, 9], 2, ["Sud"]),
+    ("melon", "fruit", [6, 7, 8, 9], 2, ["Sud", "Centre"]),
+    ("framboise", "fruit", [6, 7, 8, 9], 3, ["Est", "Centre"]),
+    ("prune", "fruit", [7, 8, 9], 2, ["Est", "Sud"]),
+    ("raisin", "fruit", [8, 9, 10], 2, ["Sud", "Est"]),
+    ("figue", "fruit", [8, 9, 10], 3, ["Sud"]),
+    ("coing", "fruit", [10, 11, 12], 2, ["Sud", "Centre"]),
+    ("châtaigne", "fruit", [10, 11, 12], 2, ["Sud"]),
+]
+
+# Étapes de plan devenues inutiles puisque la liste est fournie : uniquement celles
+# qui se contentent d'identifier/lister des produits de saison. Une étape qui
+# compose, planifie ou fait les courses garde son travail, même si elle parle de saison.
+SEASONAL_LOOKUP_VERB = re.compile(r"\b(identifi\w*|lister|listez|recens\w*|determin\w*|repere\w*)\b")
+SEASONAL_PRODUCE = re.compile(r"\b(produits?|fruits?|legumes?|ingredients?)\b.*\b(de saison|saisonniers?|du mois)\b")
+OTHER_WORK = re.compile(
+    r"\b(compos|planifi|prepar|cuisin|recette|courses|achat|achet|equilibr|elabor|redig|repartir)\w*"
+)
+
+
+def produce_fingerprint() -> str:
+    """Empreinte de la table : la changer invalide les caches de menus (partie2/partie3)."""
+    return make_key(PRODUCE)[:16]
+
+
+def resolve_seasonal(constraints: str, today: datetime = None, max_per_category: int = 8) -> dict:
+    """
+    Résout mois/saison, budget et région d'une demande en une liste courte de
+    produits. Sans mois ni saison explicite, on prend le mois courant. La région
+    est une préférence (ses produits passent en tête), pas un filtre : la table
+    est trop petite pour qu'une région couvre seule toutes les catégories.
+    """
+    text = normalize(constraints)
+    today = today or datetime.now()
+
+    months = [i + 1 for i, m in enumerate(MONTHS) if re.search(rf"\b{m}\b", text)]
+    label = ", ".join(LABELS.get(MONTHS[m - 1], MONTHS[m - 1]) for m in months)
+    if not months:
+        season = next((s for s in SEASON_MONTHS if re.search(rf"\b{s}\b", text)), None)
+        if season:
+            months, label = SEASON_MONTHS[season], LABELS.get(season, season)
+        else:
+            months = [today.month]
+            label = LABELS.get(MONTHS[today.month - 1], MONTHS[today.month - 1])
+
+    tight_budget = bool(re.search(r"\b(budget (serre|limite|reduit)|petit budget|pas cher|economique|etudiant)\b", text))
+    max_price = 1 if tight_budget else 3
+    region = next((REGIONS[r] for r in REGIONS if re.search(rf"\b{r}\b", text)), None)
+
+    selected = {categorie: [] for categorie in dict.fromkeys(p[1] for p in PRODUCE)}
+    # Produits de la région d'abord, puis les moins chers : la liste reste courte et utile
+    for nom, categorie, produce_months, prix, regions in sorted(PRODUCE, key=lambda p: (region not in p[4], p[3])):
+        if not all(m in produce_months for m in months) or prix > max_price:
+            continue
+        items = selected[categorie]
+        if len(items) < max_per_category:
+            items.append(nom)
+
+    produce = {categorie: noms for categorie, noms in selected.items() if noms}
+    return {"label": label, "region": region, "tight_budget": tight_budget, "produce": produce}
+
+
+def format_seasonal(seasonal: dict) -> str:
+    """Ligne compacte à injecter dans un prompt."""
+    details = [seasonal["label"]]
+    if seasonal["region"]:
+        details.append(f"produits {seasonal['region']} en tête")
+    if seasonal["tight_budget"]:
+        details.append("petits prix")
+    lists = "; ".join(f"{categorie}s : {', '.join(noms)}" for categorie, noms in seasonal["produce"].items())
+    return f"Produits de saison ({', '.join(details)}) : {lists or 'aucun produit frais référencé'}."
+
+
+def skip_seasonal_steps(steps: list) -> list:
+    """Retire les étapes "identifier les ingrédients de saison" d'un plan (déjà résolues localement)."""
+    def is_lookup(step) -> bool:
+        text = normalize(str(step))
+        return bool(SEASONAL_LOOKUP_VERB.search(text) and SEASONAL_PRODUCE.search(text)
+                    and not OTHER_WORK.search(text))
+
+    kept = [s for s in steps if not is_lookup(s)]
+    return kept or steps
@@ -0,0 +1,132 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from smolagents import Tool
+from result_store import ResultStore, make_key
+from agent_budget import RunBudget, run_with_budget
+
+# SESSIONS DE TABLE PERSISTANTES
+#
+# Au lieu de garder un CodeAgent vivant avec reset=False (une seule table par
+# process, tout perdu au redémarrage), chaque table a un état compact sur disque :
+# la commande structurée + les derniers échanges résumés. Chaque tour repart
+# d'un agent neuf qui reçoit cet état au lieu de rejouer tout l'historique.
+
+
+MAX_ANSWER_CHARS = 400
+
+
+class OrderTool(Tool):
+    """
+    Commande de la table en cours, branchée sur l'état de session via `bind`.
+    Les prix viennent de la carte, pas du modèle.
+    """
+    name = "commande"
+    description = (
+        "Gère la commande de la table. action='ajouter' ou 'retirer' avec un plat (et une quantité), "
+        "'vider' pour tout annuler, 'voir' pour obtenir la commande détaillée et le total (l'addition)."
+    )
+    inputs = {
+        "action": {"type": "string", "description": "ajouter, retirer, vider ou voir."},
+        "plat": {"type": "string", "description": "Nom exact du plat (pour ajouter/retirer).", "nullable": True},
+        "quantite": {"type": "integer", "description": "Nombre de portions, au moins 1 (défaut : 1).", "nullable": True},
+    }
+    output_type = "string"
+
+    def __init__(self, menu: list):
+        super().__init__()
+        self.prices = {p["nom"].lower(): (p["nom"], p["prix"]) for p in menu}
+        self.order = {"items": {}}
+
+    def bind(self, order: dict) -> None:
+        self.order = order
+
+    def forward(self, action: str, plat: str = None, quantite: int = None) -> str:
+        items = self.order["items"]
+        action = action.lower()
+        quantite = 1 if quantite is None else quantite
+        if quantite < 1:
+            return f"Quantité invalide : {quantite}. Indique un nombre de portions d'au moins 1."
+
+        if action in ("ajouter", "retirer"):
+            if not plat or plat.lower() not in self.prices:
+                return f"Plat inconnu : {plat}. Utilise menu_search pour trouver le nom exact."
+            nom, _ = self.prices[plat.lower()]
+            if action == "ajouter":
+                items[nom] = items.get(nom, 0) + quantite
+            else:
+                items[nom] = max(0, items.get(nom, 0) - quantite)
+                if not items[nom]:
+                    del items[nom]
+        elif action == "vider":
+            items.clear()
+        elif action != "voir":
+            return "Action inconnue : utilise ajouter, retirer, vider ou voir."
+
+        return format_order(self.order, self.prices)
+
+
+def format_order(order: dict, prices: dict) -> str:
+    if not order["items"]:
+        return "Commande vide."
+    lines, total = [], 0
+    for nom, quantite in order["items"].items():
+        prix = prices[nom.lower()][1]
+        total += prix * quantite
+        lines.append(f"- {quantite} x {nom} ({prix}€) = {prix * quantite}€")
+    return "\n".join(lines + [f"TOTAL : {total}€"])
+
+
+class TableSessionStore:
+    """
+    Sessions de table sur disque. Plusieurs tables peuvent être servies en
+    parallèle dans le même process : chaque tour emprunte un agent au pool
+    (voir agent_pool.py) et un verrou par table sérialise les tours d'une même table.
+    """
+
+    def __init__(self, directory: str, agent_pool, max_turns_kept: int = 3, turn_budget: dict = None):
+        self.store = ResultStore(directory)
+        self.agent_pool = agent_pool
+        self.max_turns_kept = max_turns_kept
+        self.turn_budget = turn_budget or {"deadline_s": 90, "max_tokens": 40000}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, table_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(table_id, threading.Lock())
+
+    def load(self, table_id: str) -> dict:
+        return self.store.get(make_key("table", table_id)) or {"table_id": table_id, "order": {"items": {}}, "turns": []}
+
+    def _build_task(self, session: dict, message: str, order_summary: str) -> str:
+        turns = "\n".join(f"Client : {t['client']}\nServeur : {t['serveur']}" for t in session["turns"]) or "Aucun."
+        return (
+            f"Commande actuelle de la table (outil 'commande') :\n{order_summary}\n\n"
+            f"Derniers échanges :\n{turns}\n\n"
+            f"Nouvelle demande du client : {message}"
+        )
+
+    def ask(self, table_id: str, message: str, budget: RunBudget = None) -> str:
+        """
+        Un tour de dialogue pour une table : charge l'état compact, exécute, sauvegarde.
+        `budget` peut être partagé entre les tours ; sinon chaque tour a son propre budget.
+        """
+        with self._lock(table_id):
+            session = self.load(table_id)
+            with self.agent_pool.checkout() as agent:
+                order_tool = agent.tools["commande"]
+                order_tool.bind(session["order"])
+
+                task = self._build_task(session, message, order_tool.forward("voir"))
+                answer = str(run_with_budget(agent, task, budget or RunBudget(**self.turn_budget)))
+
+            # Seul un résumé court de la réponse est gardé : la commande fait foi
+            turn = {"client": message, "serveur": answer[:MAX_ANSWER_CHARS]}
+            session["turns"] = (session["turns"] + [turn])[-self.max_turns_kept:]
+            self.store.put(make_key("table", table_id), session)
+            return answer
+
+    def ask_many(self, requests: list, max_workers: int = 8) -> list:
+        """Sert plusieurs tables en parallèle : `requests` = [(table_id, message), ...], une demande par table."""
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda r: self.ask(*r), requests))
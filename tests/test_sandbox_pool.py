@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from sandbox_pool import SandboxPool
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=2, cpu_s=5, mem_mb=256, wall_s=20, pin_wait_s=0.5)
+    yield pool
+    pool.close()
+
+
+def run(pool, session, started, pinned, code, tools=None):
+    return pool.run(session, started, pinned, {}, {}, code, tools or {}, ["json"], 10_000)
+
+
+def test_crossed_managed_agents_do_not_deadlock(pool):
+    """Managers A (W1) et B (W2) appellent chacun un agent épinglé sur le worker de l'autre."""
+    w1, w2 = list(pool._workers)
+    # Épinglage : A et b sur W1, B et a sur W2
+    pool._pins.update({w1: 2, w2: 2})
+    both_holding = threading.Barrier(2, timeout=10)
+    results = {}
+
+    def managed(name, pinned):
+        def call():
+            both_holding.wait()
+            _, output, _, _, error, _ = run(pool, name, True, pinned, f"'{name} ok'")
+            assert error is None
+            return output
+        return call
+
+    def manager(name, pinned, sub, sub_pinned):
+        _, output, _, _, error, _ = run(pool, name, False, pinned, "call_sub()", {"call_sub": managed(sub, sub_pinned)})
+        results[name] = (output, error)
+
+    threads = [
+        threading.Thread(target=manager, args=("A", w1, "a", w2), daemon=True),
+        threading.Thread(target=manager, args=("B", w2, "b", w1), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=15)
+
+    assert not any(thread.is_alive() for thread in threads), pool.stats()
+    assert results == {"A": ("a ok", None), "B": ("b ok", None)}
+    assert pool.stats()["grown"] == 2
+    assert pool.stats()["lost_sessions"] == 2
+
+
+def test_session_keeps_its_worker_across_steps(pool):
+    worker_id, _, _, _, error, lost = run(pool, "s", False, None, "import json\ndef f(x):\n    return json.dumps(x)")
+    assert error is None and not lost
+    again, output, _, _, error, lost = run(pool, "s", True, worker_id, "f([1])")
+    assert (again, output, error, lost) == (worker_id, "[1]", None, False)
@@ -0,0 +1,41 @@
+import pytest
+
+from seasonal_produce import skip_seasonal_steps
+
+
+@pytest.mark.parametrize("step", [
+    "Identifier les légumes de saison disponibles en octobre",
+    "Lister les fruits et légumes de saison",
+    "Recenser les produits du mois",
+    "Déterminer quels produits saisonniers utiliser",
+])
+def test_pure_seasonal_lookup_is_skipped(step):
+    assert skip_seasonal_steps([step, "Équilibrer les repas"]) == ["Équilibrer les repas"]
+
+
+@pytest.mark.parametrize("step", [
+    "Choisir les légumes de saison et composer les déjeuners et dîners",
+    "Sélectionner des recettes de saison économiques pour le petit-déjeuner",
+    "Établir la liste de courses avec les produits de saison",
+    "Identifier les légumes de saison et planifier les repas de la semaine",
+    "Identifier les protéines",
+    "Équilibrer les repas",
+])
+def test_steps_with_real_work_are_kept(step):
+    assert skip_seasonal_steps([step]) == [step]
+
+
+def test_plan_keeps_meal_composition_steps():
+    plan = [
+        "Identifier les légumes de saison",
+        "Choisir les légumes de saison et composer les déjeuners et dîners",
+        "Sélectionner des recettes de saison économiques pour le petit-déjeuner",
+        "Établir la liste de courses avec les produits de saison",
+        "Équilibrer les repas",
+    ]
+    assert skip_seasonal_steps(plan) == plan[1:]
+
+
+def test_plan_with_only_lookup_steps_is_kept():
+    plan = ["Identifier les fruits de saison"]
+    assert skip_seasonal_steps(plan) == plan
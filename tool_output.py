@@ -0,0 +1,89 @@
+import os
+
+# SORTIES D'OUTILS COMPACTES ET BORNÉES
+#
+# Tout ce qu'un outil renvoie finit dans l'historique de l'agent et est renvoyé
+# au modèle à chaque étape suivante. Les outils paginent donc leurs résultats
+# (limit/offset), les formatent en tableau compact (une ligne d'en-tête, puis
+# une ligne par résultat) et tout ce qui dépasse MAX_OUTPUT_CHARS est tronqué
+# avec un résumé de ce qui a été omis. Une page trop longue est raccourcie de ses
+# derniers résultats (fit_page), pour que "suite : offset=..." n'en saute aucun.
+
+MAX_OUTPUT_CHARS = int(os.getenv("CHEFBOT_TOOL_OUTPUT_CHARS", "1500"))
+DEFAULT_LIMIT = int(os.getenv("CHEFBOT_TOOL_LIMIT", "10"))
+
+
+def paginate(rows: list, limit: int = None, offset: int = None):
+    """Retourne (page, total) ; limit/offset invalides ou absents -> valeurs par défaut."""
+    offset = max(0, offset or 0)
+    limit = max(1, limit or DEFAULT_LIMIT)
+    return rows[offset:offset + limit], len(rows)
+
+
+def format_table(rows: list, columns: list) -> str:
+    """Tableau compact "a|b|c" : une ligne d'en-tête, une ligne par résultat."""
+    def cell(value):
+        if isinstance(value, bool):
+            return "oui" if value else "non"
+        if isinstance(value, (list, tuple)):
+            return ",".join(map(str, value)) or "-"
+        return "-" if value is None else str(value).replace("|", "/")
+
+    lines = ["|".join(columns)]
+    lines += ["|".join(cell(row.get(col)) for col in columns) for row in rows]
+    return "\n".join(lines)
+
+
+def page_footer(total: int, offset: int, shown: int) -> str:
+    offset = max(0, offset or 0)
+    if not shown and total:
+        return f"(offset={offset} hors limites : {total} résultat(s), offset de 0 à {total - 1})"
+    if offset + shown >= total:
+        return f"({total} résultat(s) au total)"
+    return f"({shown} sur {total}, à partir de {offset} ; suite : offset={offset + shown})"
+
+
+def bound_output(text: str, max_chars: int = None) -> str:
+    """
+    Tronque une sortie trop longue ligne par ligne et ajoute un résumé de ce qui
+    a été omis, pour que le coût en tokens d'un appel d'outil reste borné.
+    """
+    max_chars = max_chars or MAX_OUTPUT_CHARS
+    if len(text) <= max_chars:
+        return text
+
+    lines = text.splitlines()
+    kept, size = [], 0
+    for line in lines:
+        if size + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    if not kept:
+        # Une seule ligne énorme : on coupe dans la ligne
+        kept = [lines[0][:max_chars]]
+
+    omitted_lines = len(lines) - len(kept)
+    omitted_chars = len(text) - sum(len(line) + 1 for line in kept)
+    return "\n".join(kept) + (
+        f"\n[sortie tronquée : {omitted_lines} ligne(s), ~{max(omitted_chars, 0)} caractères omis ; "
+        "affine la recherche ou utilise limit/offset]"
+    )
+
+
+def fit_page(page: list, total: int, offset: int, render, sep: str = "\n", max_chars: int = None) -> str:
+    """
+    Rend `page` (via `render`) suivie de son pied de page, en retirant des résultats
+    en fin de page tant que la sortie dépasse max_chars : le pied de page ne compte
+    que les résultats affichés, la page suivante reprend au premier résultat retiré.
+    """
+    max_chars = max_chars or MAX_OUTPUT_CHARS
+    if not page:
+        return page_footer(total, offset, 0)
+    for shown in range(len(page), 0, -1):
+        body, footer = render(page[:shown]), page_footer(total, offset, shown)
+        if len(body) + len(sep) + len(footer) <= max_chars:
+            return f"{body}{sep}{footer}"
+    # Un seul résultat trop long : coupé dans la ligne (il compte comme affiché)
+    room = max(1, max_chars - len(sep) - len(footer) - 1)
+    return f"{body[:room]}…{sep}{footer}"